@@ -4,19 +4,69 @@ Author: tluettje@techfak.uni-bielefeld.de
 License: AGPL v3
 """
 import argparse
+import array
 import ast
+import atexit
+import concurrent.futures
 import configparser
+import gzip
+import hashlib
+import io
+import glob
+import itertools
+import heapq
+import json
 import logging
+import math
+import mmap
 import os
 import re
+import shutil
+import socket
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 
 # Constants
 '''
 
 '''
 RESULT_HEADER = "FWD_ID,REV_ID,MATCH_ID,FWD,REV,START,STOP,LENGTH,EXP"
+# columns of the results which are stored as numbers in columnar output
+RESULT_INTEGER_COLUMNS = ('START', 'STOP', 'LENGTH', 'EXP')
+RESULT_FLOAT_COLUMNS = ('GC', 'TM')
+# columns appended to the results via --amplicon-info
+AMPLICON_INFO_HEADER = "AMPLICON,GC,TM"
+# suffix of the index of a FASTA file, compatible to 'samtools faidx'
+FASTA_INDEX_SUFFIX = '.fai'
+# monovalent cation concentration in mM used for the melting temperature of
+# amplicons if PRIMER_SALT_MONOVALENT is not set, the default of primer3
+DEFAULT_SALT_MONOVALENT = 50.0
+# compression of the results selected by the suffix of the output
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+# number of results written at once as one row group of a Parquet file
+PARQUET_ROW_GROUP_SIZE = 100000
+# tables and indexes of the result database, see --db
+RESULT_DB_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, started TEXT, settings_hash TEXT, settings TEXT,
+    fasta TEXT, index_path TEXT, index_mtime REAL);
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY, run_id INTEGER REFERENCES runs(id),
+    fwd_id TEXT, rev_id TEXT, fwd TEXT, rev TEXT, context TEXT,
+    matches INTEGER);
+CREATE TABLE IF NOT EXISTS hits (
+    pair_id INTEGER REFERENCES pairs(id), match_id TEXT, start INTEGER,
+    stop INTEGER, length INTEGER, exp INTEGER);
+CREATE INDEX IF NOT EXISTS pairs_sequences ON pairs (fwd, rev, context);
+CREATE INDEX IF NOT EXISTS pairs_run ON pairs (run_id);
+CREATE INDEX IF NOT EXISTS hits_pair ON hits (pair_id);
+CREATE INDEX IF NOT EXISTS hits_match ON hits (match_id);
+CREATE INDEX IF NOT EXISTS runs_index ON runs (index_path, index_mtime);
+'''
 LOGGING_LEVEL = {'WARNING': logging.WARNING,
                  'ERROR': logging.ERROR,
                  'INFO': logging.INFO,
@@ -41,6 +91,108 @@ primer3_pair_ok_region_list = []
 
 sequence_included_region = ()
 
+# ids of the forward and reverse primer of a pair, keyed like primer_dict;
+# only needed if the sorted ids of the key do not start with the forward one
+primer_pair_ids = {}  # type: dict
+
+# additional information about a pair, keyed like primer_dict, e.g. its
+# 'target' and the 'penalty' assigned by primer3
+primer_pair_info = {}  # type: dict
+
+# ids of all identical records, keyed by the id of their representative
+# inside a deduplicated index; records without duplicates are missing
+reference_members = {}  # type: dict
+
+# begin and end of the region of interest of every window of a tiled region
+tile_windows = []  # type: list
+
+# magic number at the beginning of files compressed via gzip or bgzip
+GZIP_MAGIC = b'\x1f\x8b'
+
+# number of characters read at once while parsing FASTA files
+FASTA_CHUNK_SIZE = 1 << 20
+
+# positions of the fields inside the records extracted from SAM lines
+SAM_QNAME, SAM_FLAG, SAM_RNAME, SAM_POS, SAM_PNEXT, SAM_TLEN, SAM_MD = range(7)
+# first character of lines of the SAM header
+SAM_HEADER_CHAR = ord('@')
+# estimated memory in bytes of the records of one hit of a pair and of one
+# result, used to respect --max-memory
+SAM_PAIR_RECORD_BYTES = 512
+RESULT_ROW_BYTES = 512
+# hits per pair assumed for the first batch of pairs passed to bowtie
+ESTIMATED_HITS_PER_PAIR = 10
+
+# suffix of the manifest describing the shards of a sharded bowtie index
+INDEX_MANIFEST_SUFFIX = '.manifest.json'
+INDEX_MANIFEST_VERSION = 1
+# suffixes of the deduplicated records an index is built on and of the table
+# assigning the removed duplicates to their representative
+# a deduplicated index is built next to the index of all records
+DEDUP_INDEX_SUFFIX = '.dedup'
+DEDUP_FASTA_SUFFIX = '.fa'
+DEDUP_MEMBERS_SUFFIX = '.members.tsv'
+
+# complement of all IUPAC codes
+COMPLEMENT = str.maketrans('ACGTUMRWSYKVHDBN', 'TGCAAKYWSRMBDHVN')
+# bases represented by the IUPAC codes of degenerate primer
+IUPAC_BASES = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'U': 'T',
+               'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT',
+               'M': 'AC', 'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG',
+               'N': 'ACGT'}
+
+# number of primer combinations scored at once by one process
+PANEL_SCORE_CHUNK_SIZE = 500
+# number of hits whose binding sites are scored together, see --thermo-filter
+THERMO_BATCH_SIZE = 20000
+PANEL_REPORT_HEADER = ('FWD_ID_A,REV_ID_A,PRIMER_A,FWD_ID_B,REV_ID_B,PRIMER_B,'
+                       'DELTA_G')
+
+# cost of a conflict between two pairs selected for one panel, high enough to
+# prefer any selection without conflicts
+PANEL_CONFLICT_COST = 1000.0
+PANEL_SELECTION_HEADER = 'TARGET,FWD_ID,REV_ID,FWD,REV,PENALTY,OFF_TARGET_HITS'
+
+# range of the length of the k-mers counted by the k-mer table
+KMER_MIN_SIZE = 10
+KMER_MAX_SIZE = 14
+# counts of the k-mer table are stored as unsigned 16-bit integers
+KMER_MAX_COUNT = 0xffff
+KMER_TABLE_MAGIC = b'GPKMER\x01'
+KMER_TABLE_HEADER_SIZE = 16
+# number of k-mers counted at once if numpy is used
+KMER_CHUNK_SIZE = 1 << 24
+# 2-bit encoding of the bases, all other characters are encoded as 4
+BASE_CODES = bytes(
+    {ord('A'): 0, ord('C'): 1, ord('G'): 2, ord('T'): 3,
+     ord('a'): 0, ord('c'): 1, ord('g'): 2, ord('t'): 3}.get(i, 4)
+    for i in range(256))
+
+# default of PRIMER_MAX_SIZE used by primer3
+PRIMER3_DEFAULT_MAX_SIZE = 27
+TILING_PATH_HEADER = ('WINDOW,BEGIN,END,FWD_ID,REV_ID,FWD,REV,'
+                      'PRODUCT_START,PRODUCT_END,PENALTY')
+
+# directories of a work queue, a unit is moved between the first four of them
+# by atomic renames, see queue_init
+QUEUE_DIRS = ('pending', 'claimed', 'done', 'failed', 'results')
+QUEUE_DESCRIPTION = 'queue.json'
+# separates the unit from the claiming worker, which is named after its host
+# and therefore may contain dots but no '@'
+QUEUE_CLAIM_SEP = '@'
+# seconds a worker waits before it looks for new units again, see --wait
+QUEUE_POLL_INTERVAL = 5
+
+# version of the format of settings snapshots written via --save-settings
+SETTINGS_SNAPSHOT_VERSION = 1
+
+# hash of the effective settings of this run, used as key for the caches
+settings_hash = ''
+
+# private directory of this run holding pipes and temporary files, see
+# run_workspace
+workspace = None
+
 # various runtime parameters and their default values
 runtime_parameters = {'fasta_file': None,
                       'seq_id': '',
@@ -51,7 +203,39 @@ runtime_parameters = {'fasta_file': None,
                       'prefix': 'genuprimer',
                       'bowtie': 'bowtie',
                       'keep_primer': False,
-                      'show_bowtie_output': False}
+                      'no_primerfiles': False,
+                      'db': None,
+                      'show_bowtie_output': False,
+                      'save_settings': None,
+                      'load_settings': None,
+                      'cache_dir': None,
+                      'checkpoint_dir': None,
+                      'resume': False,
+                      'stream_output': False,
+                      'output_format': 'csv',
+                      'compression': None,
+                      'mmap_sam': False,
+                      'shard_size': None,
+                      'threads': 1,
+                      'panel_check': False,
+                      'panel_kmer': 5,
+                      'panel_max_dg': -9000.0,
+                      'panel_report': None,
+                      'panel_drop': False,
+                      'optimize_panel': None,
+                      'panel_time_budget': 10.0,
+                      'kmer_max_count': None,
+                      'kmer_misprime_library': None,
+                      'tile': None,
+                      'tile_overlap': 50,
+                      'tile_output': None,
+                      'max_degenerate_variants': 64,
+                      'dedup_reference': None,
+                      'amplicon_info': False,
+                      'max_memory': None,
+                      'thermo_filter': False,
+                      'thermo_max_dg': -12000.0,
+                      'merge_overlapping': False}
 
 
 def default_string(key: str, dicts: dict) -> str:
@@ -71,6 +255,15 @@ arg_description = """
         afterwards validate their uniqueness among other sequences by calling
         bowtie. The same can be accomplished for already existing primer pairs.
         """
+arg_db_query_description = """
+        Queries the runs, primer pairs and hits stored in a result database
+        written via --db. Results are written as CSV to STDOUT.
+        """
+arg_queue_description = """
+        Distributes the design and validation of primer for many target
+        sequences across several workers, e.g. on different nodes of a
+        cluster, via a work queue inside a directory on a shared filesystem.
+        """
 arg_fasta_file_help = "File containing the sequences in FASTA-Format" + \
                       default_string('fasta_file', runtime_parameters)
 
@@ -100,6 +293,12 @@ arg_output_help = """Output where the results should be stored.
 arg_keep_primer_help = """Set this option to start another run with the same primers from
         last run or some custom ones."""
 
+arg_max_degenerate_variants_help = """Maximal number of pairs of variants every
+        pair of degenerate primer with IUPAC codes is expanded to before it is
+        passed to bowtie. Variants only differing outside of the last
+        LAST_TO_CHECK bases are collapsed into one.""" + \
+    default_string('max_degenerate_variants', runtime_parameters)
+
 arg_last_must_match_help = """How many of the last bases of a primer have to match to consider
 it a hit?""" + default_string('LAST_MUST_MATCH',
                               bowtie_parse_options)
@@ -133,6 +332,143 @@ arg_bowtie_help = """The bowtie executable if not in PATH. If needed bowtie-buil
         is expected to be found via appending '-build' to bowtie.""" + \
                   default_string('bowtie', runtime_parameters)
 
+arg_save_settings_help = """Write the parsed config and commandline settings into a
+        validated and hashed snapshot file which can be passed to later runs
+        via --load-settings. If path_to_fasta_file is omitted, only the
+        snapshot is written and the program exits afterwards."""
+
+arg_load_settings_help = """Load the settings from a snapshot file created via
+        --save-settings instead of parsing the configfile. Options passed on
+        the commandline still take precedence."""
+
+arg_cache_dir_help = """Directory where the generated primer and the results of
+        bowtie are cached, keyed by the hash of the settings. Runs with the
+        same settings reuse these results instead of recomputing them."""
+
+arg_checkpoint_dir_help = """Directory where the designed primer, the alignments
+        against every index or shard and the evaluated results are stored as
+        soon as they are complete."""
+
+arg_resume_help = """Continue an interrupted run from the checkpoints inside
+        --checkpoint-dir, skipping every completed stage whose inputs and
+        settings are unchanged."""
+
+arg_stream_output_help = """Write the results of every primer pair as soon as they
+        are complete instead of collecting all of them first. The results are
+        then ordered like the output of bowtie and not by their number of
+        matches."""
+
+arg_output_format_help = """Format of the results. 'columnar' writes a Parquet file if
+        pyarrow is installed and tab separated values otherwise.""" + \
+                         default_string('output_format', runtime_parameters)
+
+arg_compression_help = """Compress the results via gzip or zstd. Selected
+        automatically if the name of the output ends with '.gz' or '.zst'."""
+
+arg_db_help = """SQLite database storing the settings, primer pairs and hits of
+        every run. Pairs which have already been validated against the same
+        index with the same settings are taken from it instead of calling
+        bowtie again. Query it via '%(prog)s --db-query'."""
+
+arg_db_query_help = """Query a result database written via --db instead of
+        running genuprimer, has to be the first argument. All following
+        arguments are passed to the query, see '%(prog)s --db-query -h'."""
+
+arg_queue_help = """Distribute runs for many target sequences via a work
+        queue instead of running genuprimer, has to be the first argument. All
+        following arguments are passed to the queue, see
+        '%(prog)s --queue -h'."""
+
+arg_no_primerfiles_help = """Do not write the designed primer to the files
+        defined via -p/--primerfiles. The primer are streamed to bowtie in any
+        case, the files are only needed to start another run with
+        --keep-primer."""
+
+arg_max_memory_help = """Approximate memory in MiB used for the results of bowtie and
+        the evaluated results. Pairs are passed to bowtie in batches sized
+        by the number of hits of the previous batch and evaluated results
+        are sorted on disk if necessary."""
+
+arg_mmap_sam_help = """Let bowtie write its results into a temporary file which is
+        memory mapped and scanned without decoding every line. Reduces CPU
+        time and memory for huge numbers of hits."""
+
+arg_dedup_reference_help = """Use a bowtie index built on one representative of every
+        group of identical records of FastaFile, next to the given or default
+        index with suffix '.dedup'. Hits on a representative are counted as
+        one match and either reported for every member of the group or once
+        for the representative."""
+
+arg_amplicon_info_help = """Add the sequence of every amplicon, its GC content and its
+        melting temperature to the results. The sequences are read from an
+        index of FastaFile compatible to 'samtools faidx', which is created
+        if necessary."""
+
+arg_merge_overlapping_help = """Merge overlapping matches of a pair on the same strand of
+        the same sequence into one match before they are counted."""
+
+arg_thermo_filter_help = """Calculate the delta G of the duplex of both primer with the
+        sequences of every unexpected hit via primer3 and drop hits where
+        one of them binds weaker than --thermo-max-dg."""
+
+arg_thermo_max_dg_help = """Delta G in cal/mol both primer of an unexpected hit have
+        to reach to keep it, see --thermo-filter.""" + \
+    default_string('thermo_max_dg', runtime_parameters)
+
+arg_shard_size_help = """Split the bowtie index of FastaFile into shards of
+        roughly this many bases which are built and searched in parallel.
+        Only shards containing added or changed records are rebuilt."""
+
+arg_threads_help = """Number of threads used to build and search sharded bowtie
+        indexes.""" + default_string('threads', runtime_parameters)
+
+arg_panel_check_help = """Screen all primer pairs for heterodimers between primer
+        of different pairs, as they would form if all pairs are used together
+        in one multiplex panel."""
+
+arg_panel_kmer_help = """Number of bases at the 3'-end of a primer which have to be
+        complementary to another primer to score the heterodimer of both.""" + \
+                      default_string('panel_kmer', runtime_parameters)
+
+arg_panel_max_dg_help = """Heterodimers with a lower delta G in cal/mol are
+        considered incompatible.""" + \
+                        default_string('panel_max_dg', runtime_parameters)
+
+arg_panel_report_help = """Write all incompatible primer found by --panel-check
+        to this file as comma separated values."""
+
+arg_panel_drop_help = """Drop incompatible primer pairs found by --panel-check
+        before their validation, pairs with the most conflicts first."""
+
+arg_optimize_panel_help = """Select one primer pair per target which can be used
+        together in one multiplex panel and write them to this file. Targets
+        are annotated via 'target=' in the header of the forward primer,
+        otherwise -s/--sequence is used."""
+
+arg_panel_time_budget_help = """Maximal number of seconds spent for the selection
+        via --optimize-panel.""" + default_string('panel_time_budget',
+                                                   runtime_parameters)
+
+arg_kmer_max_count_help = """Reject primer pairs before calling bowtie if the last
+        bases of one of their primer occur more often inside FastaFile. The
+        occurrences are looked up in a table of all k-mers of FastaFile, with
+        k close to LAST_TO_CHECK, built once next to the bowtie index."""
+
+arg_kmer_misprime_library_help = """Pass this many of the most frequent k-mers of
+        FastaFile to primer3 as mispriming library, see --kmer-max-count."""
+
+arg_tile_help = """Cover this region of the sequence with overlapping products
+        instead of generating primer for one region of interest (--pos). The
+        region is split into windows which are designed in parallel."""
+
+arg_tile_overlap_help = """Minimal overlap of the regions of interest of adjacent
+        windows of --tile.""" + default_string('tile_overlap',
+                                              runtime_parameters)
+
+arg_tile_output_help = """Write one primer pair per window of --tile to this file,
+        selected so that the products of adjacent windows overlap and every
+        pair only has its expected hit."""
+
 found_config_msg = 'Found [{conf}]-config in configfile'
 
 key_is_not_a_number_msg = 'Key {k} in [{conf}]-config is not a number'
@@ -279,19 +615,194 @@ def parse_config_and_parameters(args: argparse.Namespace,
     logging.debug('Final parameter for primer3: {}'.format(primer3_options))
 
 
+def current_settings() -> dict:
+    """
+    Collects all settings which influence the generation of primer and the
+    evaluation of the bowtie results.
+    :return: Dictionary which can be serialized as JSON
+    """
+    return {'bowtie_parse_options': dict(bowtie_parse_options),
+            'config_region_keys': dict(CONFIG_REGION_KEYS),
+            'primer3_options': dict(primer3_options),
+            'primer3_product_size': list(primer3_product_size),
+            'primer3_insert_pos': list(primer3_insert_pos)}
+
+
+def hash_settings(settings: dict) -> str:
+    """
+    Calculates a stable hash of the given settings.
+    :param settings: Settings as returned by current_settings
+    :return: hexadecimal sha256 digest
+    """
+    serialized = json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def save_settings_snapshot(path: str):
+    """
+    Writes the current settings together with their hash to a snapshot file.
+    The file is written to a temporary location first and moved afterwards so
+    that concurrent runs never read a partial snapshot.
+    :param path: Location of the snapshot file
+    """
+    settings = current_settings()
+    snapshot = {'version': SETTINGS_SNAPSHOT_VERSION,
+                'hash': hash_settings(settings),
+                'settings': settings}
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file, sort_keys=True, indent=1)
+    os.replace(tmp_path, path)
+    logging.info('Wrote settings snapshot {} to {}'.format(
+        snapshot['hash'], path))
+
+
+def load_settings_snapshot(path: str):
+    """
+    Reads a snapshot created by save_settings_snapshot, verifies its hash and
+    applies the contained settings.
+    :param path: Location of the snapshot file
+    """
+    global primer3_product_size
+    global primer3_insert_pos
+    try:
+        with open(path, 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        settings = snapshot['settings']
+        if snapshot['version'] != SETTINGS_SNAPSHOT_VERSION:
+            logging.error('Settings snapshot {} has unsupported version {}. '
+                          'Aborting'.format(path, snapshot['version']))
+            sys.exit(1)
+        if hash_settings(settings) != snapshot['hash']:
+            logging.error('Hash of settings snapshot {} does not match its '
+                          'content. Aborting'.format(path))
+            sys.exit(1)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error('Could not read settings snapshot {}: {}. '
+                      'Aborting'.format(path, e))
+        sys.exit(1)
+    bowtie_parse_options.update(settings['bowtie_parse_options'])
+    CONFIG_REGION_KEYS.update(settings['config_region_keys'])
+    primer3_options.update(settings['primer3_options'])
+    primer3_product_size = tuple(settings['primer3_product_size'])
+    primer3_insert_pos = tuple(settings['primer3_insert_pos'])
+    logging.info('Loaded settings snapshot {} from {}'.format(
+        snapshot['hash'], path))
+
+
+def cache_key(*parts) -> str:
+    """
+    Generates the key of a cache entry from the hash of the current settings
+    and additional values describing the cached computation.
+    :param parts: Any values which are representable as string
+    :return: hexadecimal sha256 digest
+    """
+    key = hashlib.sha256(settings_hash.encode('utf-8'))
+    for part in parts:
+        key.update(b'\0' + str(part).encode('utf-8'))
+    return key.hexdigest()
+
+
+def cache_load(kind: str, key: str):
+    """
+    Looks up a cached value.
+    :param kind: Kind of the cached value, used as subdirectory
+    :param key: Key generated by cache_key
+    :return: The cached value or None if it is not cached or no cache is used
+    """
+    if not runtime_parameters['cache_dir']:
+        return None
+    path = os.path.join(runtime_parameters['cache_dir'], kind, key + '.json')
+    try:
+        with open(path, 'r') as cache_file:
+            value = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    logging.info('Found cached {} results: {}'.format(kind, path))
+    return value
+
+
+def cache_store(kind: str, key: str, value):
+    """
+    Stores a value inside the cache, if a cache is used.
+    :param kind: Kind of the cached value, used as subdirectory
+    :param key: Key generated by cache_key
+    :param value: Value which can be serialized as JSON
+    """
+    if not runtime_parameters['cache_dir']:
+        return
+    cache_dir = os.path.join(runtime_parameters['cache_dir'], kind)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.json')
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as cache_file:
+        json.dump(value, cache_file)
+    os.replace(tmp_path, path)
+    logging.debug('Stored {} results in cache: {}'.format(kind, path))
+
+
+def checkpoint_load(stage: str, key: str):
+    """
+    Looks up the checkpoint of a completed stage of an interrupted run.
+    :param stage: Name of the stage, used as name of the checkpoint file
+    :param key: Key generated by cache_key from the inputs of the stage
+    :return: The value stored by checkpoint_store or None if the stage has to
+    be computed, e.g. because --resume is not set or its inputs changed
+    """
+    if not runtime_parameters['resume']:
+        return None
+    path = os.path.join(runtime_parameters['checkpoint_dir'], stage + '.json')
+    try:
+        with open(path, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('key') != key:
+        logging.info('Ignoring outdated checkpoint {}'.format(path))
+        return None
+    logging.info('Resuming {} from checkpoint {}'.format(stage, path))
+    return checkpoint['value']
+
+
+def checkpoint_store(stage: str, key: str, value):
+    """
+    Stores the result of a completed stage, if checkpoints are used. The file
+    is synced and moved to its final location afterwards so that a killed run
+    never leaves a partial checkpoint behind.
+    :param stage: Name of the stage, used as name of the checkpoint file
+    :param key: Key generated by cache_key from the inputs of the stage
+    :param value: Value which can be serialized as JSON
+    """
+    if not runtime_parameters['checkpoint_dir']:
+        return
+    os.makedirs(runtime_parameters['checkpoint_dir'], exist_ok=True)
+    path = os.path.join(runtime_parameters['checkpoint_dir'], stage + '.json')
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump({'key': key, 'value': value}, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, path)
+    logging.debug('Stored checkpoint of {}: {}'.format(stage, path))
+
+
 def validate_options():
     """
     Checks whether the given values for some parameters make sense.
     """
     # check whether we can use an existing bowtie index
-    if runtime_parameters['index'] == 'bowtie-index':
+    if runtime_parameters['index'] == 'bowtie-index' and \
+            runtime_parameters['fasta_file'] is not None:
         default_index = default_bowtie_index_location(
             runtime_parameters['fasta_file'].name)
         logging.debug(
             'No existing bowtie index specified, '
             'looking at default path: {path}'.format(
                 path=default_index))
-        if os.path.isfile(default_index + '.1.ebwt'):
+        if runtime_parameters['shard_size']:
+            # sharded indexes are built or refreshed at their location anyway
+            runtime_parameters['index'] = default_index
+        elif os.path.isfile(default_index + '.1.ebwt'):
             logging.info('Found existing bowtie index probably created by us.')
             runtime_parameters['index'] = default_index
         else:
@@ -300,9 +811,31 @@ def validate_options():
                          'be generated.')
             runtime_parameters['index'] = None
 
+    if runtime_parameters['shard_size'] is not None and \
+            runtime_parameters['shard_size'] <= 0:
+        logging.error('Size of the shards of the index must be positive')
+        sys.exit(1)
+    if runtime_parameters['threads'] < 1:
+        logging.error('Number of threads must be positive')
+        sys.exit(1)
+    if runtime_parameters['max_memory'] is not None and \
+            runtime_parameters['max_memory'] <= 0:
+        logging.error('Memory budget of --max-memory must be positive')
+        sys.exit(1)
+    if runtime_parameters['max_degenerate_variants'] < 1:
+        logging.error('Degenerate primer need at least one variant')
+        sys.exit(1)
+    if runtime_parameters['resume'] and \
+            not runtime_parameters['checkpoint_dir']:
+        logging.error('--resume needs the checkpoints of the interrupted run, '
+                      'pass them via --checkpoint-dir')
+        sys.exit(1)
+    if runtime_parameters['panel_kmer'] < 1:
+        logging.error('Number of bases for --panel-kmer must be positive')
+        sys.exit(1)
+
     global primer3_product_size
-    global primer3_insert_pos
-    # set insert position and product size
+    # set product size, the insert position is set by validate_insert_position
     if not primer3_product_size:
         if not CONFIG_REGION_KEYS['PRIMER_PRODUCT_SIZE_MIN'] or not \
             CONFIG_REGION_KEYS['PRIMER_PRODUCT_SIZE_MAX']:
@@ -314,6 +847,27 @@ def validate_options():
     if primer3_product_size[0] >= primer3_product_size[1]:
         logging.error('Product size range must be positive')
         sys.exit(1)
+    if runtime_parameters['tile']:
+        # every window of the tiled region has its own insert position
+        validate_tiling()
+    else:
+        validate_insert_position()
+
+    # select the compression of the results by the name of the output
+    output_name = str(getattr(runtime_parameters['output'], 'name', ''))
+    if not runtime_parameters['compression']:
+        for suffix, compression in COMPRESSION_SUFFIXES.items():
+            if output_name.endswith(suffix):
+                logging.info('Compressing results via {}'.format(compression))
+                runtime_parameters['compression'] = compression
+
+
+def validate_insert_position():
+    """
+    Checks the position of the region of interest and derives the regions
+    where primer3 may place the primer.
+    """
+    global primer3_insert_pos
     if not primer3_insert_pos:
         if not CONFIG_REGION_KEYS['TARGET_POSITION_BEGIN'] \
             or not CONFIG_REGION_KEYS['TARGET_POSITION_END']:
@@ -331,26 +885,109 @@ def validate_options():
     logging.debug('Selected Product Size: {}'.format(primer3_product_size))
     logging.debug('Selected Insert Position: {}'.format(primer3_insert_pos))
     global primer3_pair_ok_region_list
-    primer3_pair_ok_region_list = [
+    global sequence_included_region
+    primer3_pair_ok_region_list, sequence_included_region = \
+        compute_pair_ok_region(primer3_insert_pos, primer3_product_size)
+
+
+def compute_pair_ok_region(insert_pos: tuple, product_size: tuple) -> tuple:
+    """
+    Calculates where primer3 may place the primer around a region of interest,
+    which must not be overlapped by them.
+    :param insert_pos: begin and end of the region of interest
+    :param product_size: minimal and maximal size of the product
+    :return: tuple of the SEQUENCE_PRIMER_PAIR_OK_REGION_LIST for primer3 and
+    the region including all possible products
+    """
+    pair_ok_region_list = [
         # leftmost position
-        primer3_insert_pos[1] - primer3_product_size[1],
+        insert_pos[1] - product_size[1],
         # leftmost overlap
-        primer3_product_size[1] - (
-            primer3_insert_pos[1] - primer3_insert_pos[0]),
+        product_size[1] - (
+            insert_pos[1] - insert_pos[0]),
         # right primer has to start after insert, end will be determined by
         # product size
-        primer3_insert_pos[1],
+        insert_pos[1],
         # rightmost overlap
-        primer3_product_size[1] - (
-            primer3_insert_pos[1] - primer3_insert_pos[0]),
+        product_size[1] - (
+            insert_pos[1] - insert_pos[0]),
     ]
-    global sequence_included_region
-    sequence_included_region = tuple(
+    included_region = tuple(
         # leftmost position
-        [primer3_pair_ok_region_list[0],
+        [pair_ok_region_list[0],
          # rightmost position + rightmost overlap
-         primer3_insert_pos[1] + primer3_pair_ok_region_list[3]
+         insert_pos[1] + pair_ok_region_list[3]
          ])
+    return pair_ok_region_list, included_region
+
+
+def clip_to_template(pair_ok_region_list: list, included_region: tuple,
+                     length: int) -> tuple:
+    """
+    Clips the regions derived by compute_pair_ok_region to the template,
+    since primer3 rejects regions beginning before or ending after it.
+    Regions of interest close to the start or end of the template leave less
+    room for the primer.
+    :param pair_ok_region_list: SEQUENCE_PRIMER_PAIR_OK_REGION_LIST
+    :param included_region: begin and end of the region including all
+    possible products
+    :param length: length of the template
+    :return: tuple of the clipped SEQUENCE_PRIMER_PAIR_OK_REGION_LIST, None if
+    no room is left for one of the primer, and the clipped included region
+    """
+    left_start, left_length, right_start, right_length = pair_ok_region_list
+    if left_start < 0:
+        left_length += left_start
+        left_start = 0
+    right_length = min(right_length, length - right_start)
+    included_region = (max(0, included_region[0]),
+                       min(length, included_region[1]))
+    if left_length <= 0 or right_length <= 0:
+        return None, included_region
+    return [left_start, left_length, right_start, right_length], \
+        included_region
+
+
+def validate_tiling():
+    """
+    Checks the region which shall be covered by overlapping products and
+    splits it into windows. The region of interest of every window is as
+    large as the minimal product size allows, considering the maximal size of
+    the primer, and overlaps the next one by --tile-overlap.
+    """
+    global tile_windows
+    global sequence_included_region
+    region = tuple(runtime_parameters['tile'])
+    overlap = runtime_parameters['tile_overlap']
+    if runtime_parameters['keep_primer']:
+        logging.error('Tiling needs to generate new primer and can not be '
+                      'combined with --keep-primer. Aborting')
+        sys.exit(1)
+    if region[0] < 0 or region[0] >= region[1]:
+        logging.error('Tiled region must be positive')
+        sys.exit(1)
+    primer_max_size = primer3_options.get('PRIMER_MAX_SIZE',
+                                          PRIMER3_DEFAULT_MAX_SIZE)
+    step = primer3_product_size[0] - 2 * primer_max_size - overlap
+    if overlap < 0 or step <= 0:
+        logging.error('Overlap of the tiles must be positive and smaller than '
+                      'the minimal product size without the primer '
+                      '({}). Aborting'.format(
+                          primer3_product_size[0] - 2 * primer_max_size))
+        sys.exit(1)
+    tile_windows = []
+    begin = region[0]
+    while True:
+        end = min(begin + step + overlap, region[1])
+        tile_windows.append((begin, end))
+        if end >= region[1]:
+            break
+        begin += step
+    logging.info('Split region {} into {} windows'.format(region,
+                                                          len(tile_windows)))
+    logging.debug('Windows: {}'.format(tile_windows))
+    sequence_included_region = (max(0, region[0] - primer3_product_size[1]),
+                                region[1] + primer3_product_size[1])
 
 
 def main():
@@ -362,13 +999,28 @@ def main():
     # setup logging
     setup_logging(args.loglevel)
     logging.debug('Received arguments: {}'.format(args))
+    for option, value in (('--db-query', args.db_query),
+                          ('--queue', args.queue)):
+        if value is not None:
+            logging.error('{} has to be the first argument. '
+                          'Aborting'.format(option))
+            sys.exit(1)
+    if args.fasta_file is None and not args.save_settings:
+        logging.error('No FASTA file passed to program. Only runs creating a '
+                      'settings snapshot via --save-settings may omit it. '
+                      'Aborting')
+        sys.exit(1)
     # is path to a config given?
     if args.config:
         runtime_parameters['config'] = args.config
     # create configparser object
     config = configparser.ConfigParser()
+    if args.load_settings:
+        # settings have already been parsed and validated by an earlier run
+        load_settings_snapshot(args.load_settings)
+        config = None
     # check whether path to configfile is a valid one
-    if os.path.isfile(runtime_parameters['config']):
+    elif os.path.isfile(runtime_parameters['config']):
         # either default value or the one set per cmd argument is valid
         config.read(runtime_parameters['config'])
         logging.info(
@@ -381,6 +1033,17 @@ def main():
 
     validate_options()
 
+    global settings_hash
+    settings_hash = hash_settings(current_settings())
+    logging.debug('Hash of current settings: {}'.format(settings_hash))
+    if runtime_parameters['save_settings']:
+        save_settings_snapshot(runtime_parameters['save_settings'])
+        if runtime_parameters['fasta_file'] is None:
+            # only the snapshot has been requested, e.g. ahead of batch runs
+            logging.info('No FASTA file passed, exiting after writing the '
+                         'settings snapshot.')
+            return
+
     """
     Existing primer pairs specified via -p/--primerfiles will be read and bowtie
     run against them.
@@ -414,9 +1077,35 @@ def main():
         Generate primer pairs, depending on extracted sequence, primer3
         configuration and specified region for which primer shall be generated.
         """
-        primer_dict = generate_primer(sequence, primer3_options,
-                                      runtime_parameters['prefix'],
-                                      )
+        misprime_library = None
+        if runtime_parameters['kmer_misprime_library']:
+            misprime_library = frequent_kmers(
+                setup_kmer_table(runtime_parameters['fasta_file'].name),
+                runtime_parameters['kmer_misprime_library'])
+        primer3_cache_key = cache_key(runtime_parameters['seq_id'], sequence,
+                                      runtime_parameters[
+                                          'kmer_misprime_library'],
+                                      tile_windows)
+        cached_primer = checkpoint_load('design', primer3_cache_key)
+        if cached_primer is None:
+            cached_primer = cache_load('primer3', primer3_cache_key)
+        if cached_primer is not None:
+            primer_dict = {tuple(key): tuple(pair)
+                           for key, pair, _ in cached_primer}
+            primer_pair_info.update({tuple(key): info
+                                     for key, _, info in cached_primer})
+        elif runtime_parameters['tile']:
+            primer_dict = design_tiles(sequence, tile_windows,
+                                       primer3_options, misprime_library,
+                                       runtime_parameters['threads'])
+        else:
+            primer_dict = generate_primer(sequence, primer3_options, None,
+                                          misprime_library)
+        designed = [[key, pair, primer_pair_info.get(key, {})]
+                    for key, pair in primer_dict.items()]
+        if cached_primer is None:
+            cache_store('primer3', primer3_cache_key, designed)
+        checkpoint_store('design', primer3_cache_key, designed)
     else:
         logging.info('Trying to parse existing primer from files specified'
                      ' via -p/--primerfiles')
@@ -429,232 +1118,1525 @@ def main():
                         'sequence the hit was found.')
 
         primer_dict = parse_existing_primer(runtime_parameters['prefix'])
+
+    if runtime_parameters['panel_check']:
+        logging.info('Screening primer pairs for heterodimers inside the '
+                     'panel')
+        incompatible = screen_panel(primer_dict,
+                                    runtime_parameters['panel_kmer'],
+                                    runtime_parameters['panel_max_dg'],
+                                    runtime_parameters['threads'])
+        for first, first_position, second, second_position, dg in \
+                incompatible:
+            logging.warning('Primer {} of pair {} and primer {} of pair {} '
+                            'form a heterodimer with delta G {:.1f}'.format(
+                                pair_ids(first)[first_position], first,
+                                pair_ids(second)[second_position], second,
+                                dg))
+        if runtime_parameters['panel_report']:
+            write_panel_report(runtime_parameters['panel_report'],
+                               incompatible)
+        if runtime_parameters['panel_drop']:
+            for key in resolve_panel_conflicts(primer_dict, incompatible):
+                logging.info('Dropped pair {} because of heterodimers inside '
+                             'the panel'.format(key))
+    if not runtime_parameters['keep_primer'] and \
+            not runtime_parameters['no_primerfiles']:
+        # written after the panel check, so dropped pairs are not reused
+        write_primer_files(primer_dict, runtime_parameters['prefix'])
     # is an already existing bowtie-index specified?
-    if not runtime_parameters['index']:
+    reference = runtime_parameters['fasta_file'].name
+    if runtime_parameters['dedup_reference']:
+        # an existing index of all records is never used, a deduplicated one
+        # is built next to it
+        if not runtime_parameters['index']:
+            runtime_parameters['index'] = default_bowtie_index_location(
+                reference)
+        runtime_parameters['index'] += DEDUP_INDEX_SUFFIX
+        reference = deduplicate_reference(reference,
+                                          runtime_parameters['index'])
+    if runtime_parameters['shard_size']:
+        # sharded indexes are refreshed whenever FastaFile has been changed
+        bowtie_indexes = setup_sharded_bowtie(
+            runtime_parameters['index'],
+            reference,
+            runtime_parameters['shard_size'],
+            runtime_parameters['threads'],
+            args.loglevel == logging.DEBUG,
+            runtime_parameters['bowtie'])
+    elif runtime_parameters['dedup_reference']:
+        if index_modification_time(runtime_parameters['index']) < \
+                os.path.getmtime(reference):
+            logging.info('Building deduplicated index {}'.format(
+                runtime_parameters['index']))
+            setup_bowtie(runtime_parameters['index'],
+                         reference,
+                         args.loglevel == logging.DEBUG,
+                         runtime_parameters['bowtie'])
+        bowtie_indexes = [runtime_parameters['index']]
+    elif not runtime_parameters['index']:
         # no index available, so we have to create our own one
         runtime_parameters['index'] = default_bowtie_index_location(
             runtime_parameters['fasta_file'].name)
         setup_bowtie(runtime_parameters['index'],
-                     runtime_parameters['fasta_file'].name,
+                     reference,
                      args.loglevel == logging.DEBUG,
                      runtime_parameters['bowtie'])
         logging.info("No existing index for bowtie specified")
+        bowtie_indexes = [runtime_parameters['index']]
     else:
         logging.info("Using existing bowtie-index")
+        bowtie_indexes = [runtime_parameters['index']]
+    load_reference_members(runtime_parameters['index'])
 
-    bowtie_result = run_bowtie(runtime_parameters['index'],
-                               runtime_parameters['prefix'],
-                               runtime_parameters['bowtie'],
-                               args.loglevel == logging.WARNING,
-                               primer3_product_size,
-                               runtime_parameters['show_bowtie_output'])
-
-    # create empty list for results
-    results = {}
-    for primer_tuple in bowtie_result:
-        current_key, res = parse_bowtie_result(
-            primer_tuple,
+    if runtime_parameters['kmer_max_count'] is not None:
+        rejected = reject_repetitive_primer(
             primer_dict,
-            sequence_included_region,
-            runtime_parameters['additional_fasta'] is not None,
-            runtime_parameters['seq_id'],
-            runtime_parameters['keep_primer'])
-        if res is not None:
-            results.setdefault(current_key, []).append(res)
+            setup_kmer_table(runtime_parameters['fasta_file'].name),
+            runtime_parameters['kmer_max_count'])
+        logging.info('Rejected {} pairs with repetitive 3\'-ends before '
+                     'calling bowtie'.format(len(rejected)))
+
+    parse_arguments_of_results = (
+        primer_dict,
+        sequence_included_region,
+        runtime_parameters['additional_fasta'] is not None,
+        runtime_parameters['seq_id'],
+        runtime_parameters['keep_primer'])
+    results_checkpoint_key = cache_key(
+        runtime_parameters['index'],
+        index_modification_time(runtime_parameters['index']),
+        sorted(primer_dict.items()), result_filter_settings())
+    # results of pairs validated by earlier runs, see --db and --resume
+    reused = checkpoint_load('results', results_checkpoint_key)
+    if reused is not None:
+        reused = {tuple(key): [tuple(res) for res in matches]
+                  for key, matches in reused}
+    else:
+        reused = {}
+    if runtime_parameters['db']:
+        result_db = open_result_db(runtime_parameters['db'])
+        if not reused:
+            reused = lookup_validated_pairs(result_db, primer_dict,
+                                            runtime_parameters['index'],
+                                            parse_arguments_of_results)
+            logging.info('Reusing results of {} pairs validated by earlier '
+                         'runs'.format(len(reused)))
+        store_pair, close_store = open_result_store(
+            result_db, runtime_parameters['index'],
+            parse_arguments_of_results)
+    bowtie_primer, variant_origin = expand_degenerate_primer(
+        {key: pair for key, pair in primer_dict.items() if key not in reused},
+        runtime_parameters['max_degenerate_variants'])
+
+    bowtie_cache_key = cache_key(
+        runtime_parameters['index'],
+        index_modification_time(runtime_parameters['index']),
+        sorted(bowtie_primer.items()), 'sam-records')
+    bowtie_result = cache_load('bowtie', bowtie_cache_key)
+    if not bowtie_primer:
+        bowtie_result = []
+    elif bowtie_result is None:
+        run_bowtie_args = (runtime_parameters['bowtie'],
+                           args.loglevel == logging.WARNING,
+                           primer3_product_size,
+                           runtime_parameters['show_bowtie_output'],
+                           runtime_parameters['mmap_sam'])
+        if runtime_parameters['max_memory']:
+            # half of the budget is left for the evaluated results
+            bowtie_result = run_bowtie_batched(
+                bowtie_indexes, bowtie_primer,
+                runtime_parameters['max_memory'] << 19,
+                runtime_parameters['threads'], *run_bowtie_args)
         else:
+            bowtie_result = run_bowtie_on_indexes(
+                bowtie_indexes, bowtie_primer, runtime_parameters['threads'],
+                *run_bowtie_args)
+        if runtime_parameters['cache_dir'] and \
+                not runtime_parameters['max_memory']:
+            # all records would have to be kept in memory to store them
+            bowtie_result = list(bowtie_result)
+            cache_store('bowtie', bowtie_cache_key, bowtie_result)
+
+    result_header = RESULT_HEADER
+    if runtime_parameters['amplicon_info']:
+        result_header += ',' + AMPLICON_INFO_HEADER
+    write_results, close_output = open_result_writer(
+        runtime_parameters['output'],
+        runtime_parameters['output_format'],
+        runtime_parameters['compression'],
+        result_header)
+    if runtime_parameters['amplicon_info']:
+        fasta_index, mapped_fasta = open_indexed_fasta(
+            runtime_parameters['fasta_file'].name)
+
+        def add_amplicons(pair_matches: list) -> list:
+            return add_amplicon_info(pair_matches, fasta_index, mapped_fasta)
+    else:
+        def add_amplicons(pair_matches: list) -> list:
+            return pair_matches
+    if reference_members and \
+            runtime_parameters['dedup_reference'] != 'collapse':
+        write_sites = write_results
+
+        def write_results(matches: list):
+            # matches have been counted per site, but are reported per record
+            write_sites(expand_reference_members(
+                matches, runtime_parameters['seq_id'],
+                runtime_parameters['keep_primer']))
+    pair_results = iter_pair_results(
+        fold_variant_records(bowtie_result, variant_origin),
+        parse_arguments_of_results)
+    if variant_origin:
+        # hits of one pair are reported by several variants
+        pair_results = merge_variant_results(pair_results, variant_origin)
+    pair_results = itertools.chain(
+        pair_results,
+        ((key, matches) for key, matches in reused.items() if matches))
+    if runtime_parameters['merge_overlapping']:
+        pair_results = ((key, merge_overlapping_hits(matches))
+                        for key, matches in pair_results)
+    if runtime_parameters['thermo_filter']:
+        pair_results = thermo_filter_results(
+            pair_results, runtime_parameters['fasta_file'].name,
+            runtime_parameters['thermo_max_dg'],
+            runtime_parameters['threads'])
+    if runtime_parameters['checkpoint_dir'] and \
+            not runtime_parameters['max_memory']:
+        # evaluation has to be complete before the results are written
+        evaluated = {}  # type: dict
+        for key, matches in pair_results:
+            evaluated.setdefault(key, []).extend(matches)
+        checkpoint_store('results', results_checkpoint_key,
+                         [[key, evaluated.get(key, [])]
+                          for key in primer_dict])
+        pair_results = [(key, matches) for key, matches in evaluated.items()]
+
+    # results of all pairs which are not omitted, used to optimize the panel
+    validated = {}  # type: dict
+    if runtime_parameters['stream_output']:
+        # results of a pair are final as soon as bowtie reports the next pair
+        for key, matches in pair_results:
+            if runtime_parameters['db']:
+                store_pair(key, matches)
+            if len(matches) > bowtie_parse_options['LIMIT_NUMBER_OF_MATCHES']:
+                logging.debug(
+                    'Not printing results for {} because it has {} '
+                    'matches'.format(key, len(matches)))
+            else:
+                write_results(add_amplicons([matches])[0])
+                if runtime_parameters['optimize_panel'] or \
+                        runtime_parameters['tile']:
+                    validated[key] = matches
+    elif runtime_parameters['max_memory']:
+        # every pair is reported once, so its results are complete and only
+        # the printable ones have to be sorted
+        def printable_results():
+            for key, matches in pair_results:
+                if runtime_parameters['db']:
+                    store_pair(key, matches)
+                if len(matches) > \
+                        bowtie_parse_options['LIMIT_NUMBER_OF_MATCHES']:
+                    logging.debug(
+                        'Not printing results for {} because it has {} '
+                        'matches'.format(key, len(matches)))
+                    continue
+                if runtime_parameters['optimize_panel'] or \
+                        runtime_parameters['tile']:
+                    validated[key] = matches
+                yield key, matches
+
+        for matches in sort_results_on_disk(
+                printable_results(), runtime_parameters['max_memory'] << 19):
+            write_results(add_amplicons([matches])[0])
+    else:
+        # create empty list for results
+        results = {}
+        for key, matches in pair_results:
+            results.setdefault(key, []).extend(matches)
+
+        # store intermediate all results which would be printed in output
+        printable_res = []
+        for key in sorted(results.keys()):
+            matches = results[key]
+            if runtime_parameters['db']:
+                store_pair(key, matches)
+            if len(matches) > \
+                    bowtie_parse_options['LIMIT_NUMBER_OF_MATCHES']:
+                logging.debug(
+                    'Not printing results for {} because it has {} '
+                    'matches'.format(key, len(matches)))
+            else:
+                # add to intermediate results
+                printable_res.append(matches)
+                validated[key] = matches
+
+        # amplicons of all pairs are read in one pass over FastaFile
+        for matches in add_amplicons(sorted(printable_res, key=len)):
+            # write results
+            write_results(matches)
+    close_output()
+    if runtime_parameters['db']:
+        close_store()
+
+    if runtime_parameters['optimize_panel']:
+        selection = optimize_panel(primer_dict, validated,
+                                   runtime_parameters['panel_time_budget'])
+        write_panel_selection(runtime_parameters['optimize_panel'],
+                              primer_dict, validated, selection)
+
+    if runtime_parameters['tile']:
+        tiling_path = select_tiling_path(tile_windows, validated)
+        logging.info('Selected primer pairs for {} of {} windows'.format(
+            len(tiling_path) - tiling_path.count(None), len(tiling_path)))
+        if runtime_parameters['tile_output']:
+            write_tiling_path(runtime_parameters['tile_output'], primer_dict,
+                              tile_windows, tiling_path)
+
+
+def iter_pair_results(bowtie_result, parse_arguments_of_results: tuple):
+    """
+    Parses the bowtie results and groups the significant hits per primer pair.
+    bowtie reports all alignments of one pair consecutively, therefore the hits
+    of a pair are complete as soon as the results of the next pair start.
+    :param bowtie_result: Iterable of the tuples returned by run_bowtie
+    :param parse_arguments_of_results: Remaining arguments of
+    parse_bowtie_result following the tuple of the bowtie result
+    :return: Generator of tuples consisting of the key of the pair and the list
+    of its results
+    """
+    current_key = None
+    matches = []  # type: list
+    for primer_tuple in bowtie_result:
+        key, res = parse_bowtie_result(primer_tuple,
+                                       *parse_arguments_of_results)
+        if res is None:
             continue
+        if key != current_key:
+            if matches:
+                yield current_key, matches
+            current_key, matches = key, []
+        matches.append(res)
+    if matches:
+        yield current_key, matches
 
-    output = runtime_parameters['output']
-    # store intermediate all results which would be printed in output
-    printable_res = []
-    for key in sorted(results.keys()):
-        matches = results[key]
-        if len(matches) > bowtie_parse_options['LIMIT_NUMBER_OF_MATCHES']:
-            logging.debug(
-                'Not printing results for {} because it has {} matches'.format(
-                    key, len(matches)
-                ))
+
+def open_result_writer(output: '_io.TextIOWrapper', output_format: str,
+                       compression: str, header: str = RESULT_HEADER) -> tuple:
+    """
+    Prepares the output of the results, depending on the chosen format and
+    compression.
+    :param output: Opened file or STDOUT where the results are written to
+    :param output_format: Either 'csv' or 'columnar'. Columnar results are
+    written as Parquet if pyarrow is installed and as tab separated values
+    otherwise.
+    :param compression: None, 'gzip' or 'zstd'
+    :param header: comma separated names of the columns
+    :return: Tuple of a function writing a list of results and a function
+    finishing the output, both without arguments
+    """
+    if output_format == 'columnar':
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            logging.info('pyarrow is not installed, writing columnar results '
+                         'as tab separated values instead of Parquet')
         else:
-            # add to intermediate results
-            printable_res.append(matches)
+            return open_parquet_writer(output, compression, pyarrow, header)
+
+    separator = '\t' if output_format == 'columnar' else ','
+    if compression:
+        # compressed results have to be written to the underlying binary file
+        output.flush()
+        stream = io.TextIOWrapper(open_compressed_stream(output.buffer,
+                                                         compression))
+    else:
+        stream = output
+    stream.write(header.replace(',', separator) + '\n')
 
-    output.write(RESULT_HEADER + '\n')
-    for matches in sorted(printable_res, key=len):
-        # write results
-        output.write('\n'.join(matches))
-        # final newline at end of results
-        output.write('\n')
+    def write_results(matches: list):
+        stream.write(''.join(separator.join(map(str, res)) + '\n'
+                             for res in matches))
+        if not compression:
+            stream.flush()
 
+    def close_output():
+        if stream is not output:
+            # finish the compressed stream, but keep the output itself open
+            stream.close()
+        output.flush()
 
-def parse_existing_primer(prefix: str) -> dict:
+    return write_results, close_output
+
+
+def open_compressed_stream(raw: '_io.BufferedWriter',
+                           compression: str) -> io.RawIOBase:
     """
-    This function reads the files containing the custom primer pairs and stores
-    them in the same way newly generated would be stored. Only complete pairs
-    are stored. If one file contains m and the other n sequences, given n < m
-    only n pairs would be returned and the m-n discarded.
-    :param prefix: Prefix for files containing the primer, expected to be
-    readable from prefix_{left,right}.fas
-    :return: Dictionary containing all primer, accessible via sorted
-    concatenation of their names
+    Wraps a binary stream so that everything written to it is compressed.
+    Closing the returned stream does not close the wrapped one.
+    :param raw: binary stream the compressed data is written to
+    :param compression: either 'gzip' or 'zstd'
+    :return: binary stream accepting uncompressed data
     """
-    left_name = "{}_left.fas".format(prefix)
-    right_name = "{}_right.fas".format(prefix)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb')
     try:
-        left_primer = open(left_name, 'r')
-        right_primer = open(right_name, 'r')
-    except FileNotFoundError:
-        logging.error(
-            'Could not find or read one or both of the files '
-            'containing the primers that should be used for this run '
-            'instead of generating new one.\n'
-            'Looking for files: {} and {}. Aborting'.format(
-                left_name, right_name
-            ))
+        import zstandard
+    except ImportError:
+        logging.error('zstandard is not installed but needed to compress the '
+                      'results via zstd. Install it via pip or use gzip '
+                      'instead. Aborting')
         sys.exit(1)
+    return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
 
-    primer_left_lines = left_primer.readlines()
-    primer_right_lines = right_primer.readlines()
-    left_primer.close()
-    right_primer.close()
-
-    primer_left_list = []
-    sequence = seq_id = ""
-    for left_line in primer_left_lines:
-        # begin of new sequence
-        if left_line[0] == '>':
-            if sequence != "":
-                # we were previously reading a sequence therefore store it
-                # before starting with a new one
-
-                # sanitize sequence from newlines
-                sequence = sequence.replace('\n', '').replace('\r', '')
-                primer_left_list.append((seq_id, sequence))
-                sequence = ""
-            # extract id from header
-            seq_id = left_line.split('>')[1].split()[0]
-        else:
-            sequence += left_line
-    # append final sequence to list
-    if sequence != "":
-        sequence = sequence.replace('\n', '').replace('\r', '')
-        primer_left_list.append((seq_id, sequence))
-
-    primer_right_list = []
-    sequence = seq_id = ""
-    for right_line in primer_right_lines:
-        # begin of new sequence
-        if right_line[0] == '>':
-            if sequence != "":
-                # we were previously reading a sequence therefore store it
-                # before starting with a new one
-                sequence = sequence.replace('\n', '').replace('\r', '')
-                # sanitize sequence from newlines
-                primer_right_list.append((seq_id, sequence))
-                sequence = ""
-            # extract id from header
-            seq_id = right_line.split('>')[1].split()[0]
-        else:
-            sequence += right_line
-    if sequence != "":
-        sequence = sequence.replace('\n', '').replace('\r', '')
-        primer_right_list.append((seq_id, sequence))
-
-    logging.debug('Extracted following primer from {}: {}'.format(
-        left_name, ' ,'.join(map(str, primer_left_list))
-    ))
-    logging.debug('Extracted following primer from {}: {}'.format(
-        right_name, ' ,'.join(map(str, primer_right_list))
-    ))
-    primer_dict = {}  # type: dict
-    for (l_id, l_seq), (r_id, r_seq) in zip(primer_left_list,
-                                            primer_right_list):
-        l_seq = l_seq.replace('\n', '').replace('\r', '')
-        r_seq = r_seq.replace('\n', '').replace('\r', '')
-        primer_dict.update({tuple(sorted((l_id, r_id))): (l_seq, r_seq)})
-    return primer_dict
 
-
-def extract_fasta_seq(fasta_file: '_io.TextIOWrapper') -> str:
+def open_parquet_writer(output: '_io.TextIOWrapper', compression: str,
+                        pyarrow, header: str = RESULT_HEADER) -> tuple:
     """
-    Gets a file buffer pointing at the beginning of a sequence. The file is read
-    and the line content added to an internal buffer until a the sequence ends
-    which is either indicated by newline or the beginning of a new sequence
-    :param fasta_file: IO-wrapper of the file
-    :return: extracted sequence sanitized from newlines
+    Prepares writing the results as Parquet file, results are written in row
+    groups of PARQUET_ROW_GROUP_SIZE.
+    :param output: Opened file or STDOUT where the results are written to
+    :param compression: None, 'gzip' or 'zstd', used as compression of the
+    Parquet columns
+    :param pyarrow: the imported pyarrow module
+    :param header: comma separated names of the columns
+    :return: Tuple of a function writing a list of results and a function
+    finishing the output, see open_result_writer
     """
-    seq = ""
-    for line in fasta_file:
-        # read as long as no newline appears
-        if line in ['\n', '\r\n'] or line[0] == '>':
-            break
-        seq += line
-    return seq.replace('\n', '').replace('\r', '')
+    column_types = dict.fromkeys(RESULT_INTEGER_COLUMNS, pyarrow.int64())
+    column_types.update(dict.fromkeys(RESULT_FLOAT_COLUMNS,
+                                      pyarrow.float64()))
+    schema = pyarrow.schema(
+        [(name, column_types.get(name, pyarrow.string()))
+         for name in header.split(',')])
+    output.flush()
+    writer = pyarrow.parquet.ParquetWriter(
+        output.buffer, schema, compression=compression or 'snappy')
+    rows = []  # type: list
 
+    def flush_rows():
+        if rows:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type)
+                 for column, field in zip(zip(*rows), schema)],
+                schema=schema))
+            del rows[:]
 
-def extract_included_region(config: configparser.SectionProxy) -> tuple:
+    def write_results(matches: list):
+        rows.extend(matches)
+        if len(rows) >= PARQUET_ROW_GROUP_SIZE:
+            flush_rows()
+
+    def close_output():
+        flush_rows()
+        writer.close()
+        output.flush()
+
+    return write_results, close_output
+
+
+def open_result_db(path: str) -> sqlite3.Connection:
     """
-    This functions extracts the region for which primer shall be generated
-    from the config file.
-    :param config: contains the values.
-    :return: extracted values formatted as int
+    Opens the result database and creates its tables if necessary.
+    :param path: location of the SQLite database
+    :return: open connection
     """
-    if config is not None:
-        seq_begin = config.getint('SEQUENCE_INCLUDED_BEGIN', -1)
-        seq_end = config.getint('SEQUENCE_INCLUDED_END', -1)
-    else:
-        seq_begin = 0
-        seq_end = 0
-    # is one of the values invalid?
-    if seq_begin < 0 or seq_end < 0:
-        logging.error(
-            ('Found negative or invalid values for the region'
-             'for which the primer will be generated or have been generated if '
-             'custom primers are used via --keep-primer.'
-             '(SEQUENCE_INCLUDED_BEGIN,SEQUENCE_INCLUDED_END)'
-             ' = {}. If you want to generate primers for the '
-             'whole sequence set both values to 0. Aborting').format(
-                (config['SEQUENCE_INCLUDED_BEGIN'],
-                 config['SEQUENCE_INCLUDED_END']))
-        )
+    try:
+        connection = sqlite3.connect(path)
+        connection.executescript(RESULT_DB_SCHEMA)
+    except sqlite3.Error as e:
+        logging.error('Could not open result database {}: {}'.format(path, e))
         sys.exit(1)
-    return seq_begin, seq_end
+    return connection
 
 
-def parse_bowtie_result(primer_tuple: tuple,
-                        primer_dict: dict,
-                        seq_included_region: tuple,
-                        additional_fasta: bool,
-                        seq_id: str,
-                        keep_primer: bool) -> tuple:
+def evaluation_context(key: tuple, parse_arguments_of_results: tuple) -> str:
     """
-    Parses the bowtie result and presents them in a csv-style containing
-    the most important information.
-    :param primer_tuple: Current tuple (forward and reverse) which bowtie
-    results are now checked.
-    :param primer_dict: Dictionary containing all primer pairs, accessible via
-    sorted concatenation of fwd-primer-id and rev-primer-id.
-    :param seq_included_region: Start and stop of the region for which the
-    primer have been generated.
-    :param additional_fasta: Whether the extracted sequence's origin is an
-    additional file not indexed by bowtie.
-    :param seq_id: The whole id of the sequence for which primer have been
-    generated or a prefix defined by user if custom primer are used.
-    :param keep_primer: Whether custom primer pairs were read from files and
-    no new ones were generated.
-    :param seq_included_region: Tuple of the specified region for which primer
-    have been produced; used to check whether a match reported by bowtie is
-    expected or not
-    :return tuple of key and result for this key, where the key is the same from
-    primer_dict
+    Describes everything apart from the sequences and the index which decides
+    about the results of a pair, i.e. the settings and the region and
+    sequence a hit is expected in.
+    :param key: key of the pair inside primer_dict
+    :param parse_arguments_of_results: Remaining arguments of
+    parse_bowtie_result following the tuple of the bowtie result
+    :return: hexadecimal digest
     """
+    _, region, additional_fasta, seq_id, keep_primer = \
+        parse_arguments_of_results
+    region, seq_id = pair_expectation(key, region, seq_id)
+    return cache_key(tuple(region), additional_fasta, seq_id, keep_primer,
+                     result_filter_settings())
 
-    def is_significant(values):
-        # if last entry is a number it represents the number of matches at
-        # the end of the primer; must not be lower than given value
-        if values[-1].isdigit():
-            if int(values[-1]) < bowtie_parse_options['LAST_MUST_MATCH']:
-                # only enable line below if you really want to understand
-                # the process
+
+def lookup_validated_pairs(connection: sqlite3.Connection, primer_dict: dict,
+                           index_location: str,
+                           parse_arguments_of_results: tuple) -> dict:
+    """
+    Looks up pairs which have already been validated by an earlier run against
+    the same, unchanged index.
+    :param connection: connection to the result database
+    :param primer_dict: Dictionary containing all primer pairs
+    :param index_location: location of the index for bowtie
+    :param parse_arguments_of_results: Remaining arguments of
+    parse_bowtie_result following the tuple of the bowtie result
+    :return: Dictionary mapping the keys of the found pairs to their results,
+    rewritten to the ids of the current pairs
+    """
+    index_mtime = index_modification_time(index_location)
+    validated = {}
+    for key, (fwd, rev) in primer_dict.items():
+        row = connection.execute(
+            'SELECT pairs.id FROM pairs JOIN runs ON runs.id = pairs.run_id '
+            'WHERE pairs.fwd = ? AND pairs.rev = ? AND pairs.context = ? '
+            'AND runs.index_path = ? AND runs.index_mtime = ? '
+            'ORDER BY pairs.id DESC LIMIT 1',
+            (fwd, rev, evaluation_context(key, parse_arguments_of_results),
+             index_location, index_mtime)).fetchone()
+        if row is None:
+            continue
+        fwd_id, rev_id = pair_ids(key)
+        validated[key] = [
+            (fwd_id, rev_id, match_id, fwd, rev, start, stop, length, exp)
+            for match_id, start, stop, length, exp in connection.execute(
+                'SELECT match_id, start, stop, length, exp FROM hits '
+                'WHERE pair_id = ? ORDER BY rowid', row)]
+    return validated
+
+
+def open_result_store(connection: sqlite3.Connection, index_location: str,
+                      parse_arguments_of_results: tuple) -> tuple:
+    """
+    Records a new run inside the result database. All pairs and hits of the
+    run are inserted inside one transaction which is committed once the run
+    is finished.
+    :param connection: connection to the result database
+    :param index_location: location of the index for bowtie
+    :param parse_arguments_of_results: Remaining arguments of
+    parse_bowtie_result following the tuple of the bowtie result
+    :return: Tuple of a function storing a pair and all its results, given
+    the key of the pair, and a function finishing the run which stores the
+    remaining pairs without any significant hit
+    """
+    primer_dict = parse_arguments_of_results[0]
+    stored = set()
+    run_id = connection.execute(
+        'INSERT INTO runs (started, settings_hash, settings, fasta, '
+        'index_path, index_mtime) VALUES (?, ?, ?, ?, ?, ?)',
+        (time.strftime('%Y-%m-%dT%H:%M:%S'), settings_hash,
+         json.dumps(current_settings(), sort_keys=True),
+         runtime_parameters['fasta_file'].name, index_location,
+         index_modification_time(index_location))).lastrowid
+
+    def store_pair(key: tuple, matches: list):
+        stored.add(key)
+        fwd_id, rev_id = pair_ids(key)
+        fwd, rev = primer_dict[key]
+        pair_id = connection.execute(
+            'INSERT INTO pairs (run_id, fwd_id, rev_id, fwd, rev, context, '
+            'matches) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (run_id, fwd_id, rev_id, fwd, rev,
+             evaluation_context(key, parse_arguments_of_results),
+             len(matches))).lastrowid
+        connection.executemany(
+            'INSERT INTO hits (pair_id, match_id, start, stop, length, exp) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(pair_id,) + tuple(match[2:3]) + tuple(match[5:])
+             for match in matches])
+
+    def close_store():
+        for key in primer_dict:
+            if key not in stored:
+                store_pair(key, [])
+        connection.commit()
+        connection.close()
+        logging.info('Stored run {} in result database'.format(run_id))
+
+    return store_pair, close_store
+
+
+def query_result_db(argv: list):
+    """
+    Answers queries about the runs, pairs and hits stored in a result
+    database, invoked via 'genuprimer.py --db-query'.
+    :param argv: command line arguments following '--db-query'
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} --db-query'.format(os.path.basename(sys.argv[0])),
+        description=arg_db_query_description)
+    parser.add_argument('database', help='SQLite database written via --db')
+    queries = parser.add_subparsers(dest='query')
+    queries.required = True
+    queries.add_parser('runs', help='List all stored runs')
+    hits = queries.add_parser(
+        'hits', help='List all stored hits of pairs on the given sequence')
+    hits.add_argument('match_id', help='id of the sequence hit by the pairs')
+    hits.add_argument('--run', type=int, help='Only hits of the given run')
+    pair = queries.add_parser(
+        'pair', help='List the runs which validated the given pair')
+    pair.add_argument('fwd', help='sequence of the forward primer')
+    pair.add_argument('rev', help='sequence of the reverse primer')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.database):
+        logging.error('Result database {} does not exist'.format(
+            args.database))
+        sys.exit(1)
+    connection = open_result_db(args.database)
+    if args.query == 'runs':
+        header = ('RUN_ID', 'STARTED', 'SETTINGS_HASH', 'FASTA', 'INDEX',
+                  'PAIRS')
+        rows = connection.execute(
+            'SELECT runs.id, started, settings_hash, fasta, index_path, '
+            'COUNT(pairs.id) FROM runs LEFT JOIN pairs '
+            'ON pairs.run_id = runs.id GROUP BY runs.id ORDER BY runs.id')
+    elif args.query == 'hits':
+        header = tuple(RESULT_HEADER.split(',')) + ('RUN_ID',)
+        rows = connection.execute(
+            'SELECT fwd_id, rev_id, match_id, fwd, rev, start, stop, length, '
+            'exp, run_id FROM hits JOIN pairs ON pairs.id = hits.pair_id '
+            'WHERE match_id = ? AND (? IS NULL OR run_id = ?) '
+            'ORDER BY run_id, pairs.id, start',
+            (args.match_id, args.run, args.run))
+    else:
+        header = ('RUN_ID', 'INDEX', 'SETTINGS_HASH', 'FWD_ID', 'REV_ID',
+                  'MATCHES')
+        rows = connection.execute(
+            'SELECT run_id, index_path, settings_hash, fwd_id, rev_id, '
+            'matches FROM pairs JOIN runs ON runs.id = pairs.run_id '
+            'WHERE fwd = ? AND rev = ? ORDER BY run_id',
+            (args.fwd, args.rev))
+    sys.stdout.write(','.join(header) + '\n')
+    for row in rows:
+        sys.stdout.write(','.join(map(str, row)) + '\n')
+    connection.close()
+
+
+def queue_init(queue: str, fasta_file: str, targets: list, index: str,
+               bowtie_exec: str, options: list):
+    """
+    Creates a work queue with one unit per target sequence. Every unit is a
+    JSON file inside 'pending' which is moved to 'claimed' by the worker
+    processing it and afterwards to 'done' or 'failed'.
+    :param queue: directory of the queue, has to be reachable by all workers
+    :param fasta_file: FastaFile passed to every run of genuprimer
+    :param targets: ids of the target sequences, all sequences of fasta_file
+    if empty
+    :param index: existing bowtie index of fasta_file, built inside the queue
+    if None
+    :param bowtie_exec: bowtie-executable used to build the index
+    :param options: additional options passed to every run of genuprimer
+    """
+    if os.path.exists(os.path.join(queue, QUEUE_DESCRIPTION)):
+        logging.error('Queue {} exists already'.format(queue))
+        sys.exit(1)
+    for directory in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue, directory), exist_ok=True)
+    if not targets:
+        with open_fasta(fasta_file) as fasta:
+            targets = [fasta_id(header) for header, _ in iter_fasta(fasta)]
+    if index is None:
+        index = os.path.join(queue, 'index', 'index')
+        os.makedirs(os.path.dirname(index), exist_ok=True)
+        setup_bowtie(os.path.relpath(index), fasta_file, False, bowtie_exec)
+    description = {'fasta': os.path.abspath(fasta_file),
+                   'index': os.path.abspath(index),
+                   'options': ['--bowtie', bowtie_exec] + list(options)}
+    for number, target in enumerate(targets):
+        unit = 'unit_{:06d}.json'.format(number)
+        with open(os.path.join(queue, 'pending', unit), 'w') as unit_file:
+            json.dump({'target': target}, unit_file)
+    with open(os.path.join(queue, QUEUE_DESCRIPTION), 'w') as queue_file:
+        json.dump(description, queue_file, sort_keys=True, indent=1)
+    logging.info('Created queue {} with {} units'.format(queue, len(targets)))
+
+
+def cache_index_locally(index: str, local_cache: str) -> str:
+    """
+    Copies all files of a bowtie index into a local directory, so that the
+    index is read from the shared filesystem only once per node. Concurrent
+    workers copy into their own temporary directory which is renamed
+    afterwards.
+    :param index: location of the index for bowtie
+    :param local_cache: local directory holding the copied indexes
+    :return: location of the local copy of the index
+    """
+    index_hash = hashlib.sha1('{}\0{}'.format(
+        index, index_modification_time(index)).encode('utf-8')).hexdigest()
+    local_dir = os.path.join(local_cache, index_hash)
+    if not os.path.isdir(local_dir):
+        os.makedirs(local_cache, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=index_hash + '.', dir=local_cache)
+        for path in glob.glob(glob.escape(index) + '.*'):
+            shutil.copy2(path, tmp_dir)
+        try:
+            os.rename(tmp_dir, local_dir)
+            logging.info('Copied index {} to {}'.format(index, local_dir))
+        except OSError:
+            # another worker of this node has been faster
+            shutil.rmtree(tmp_dir, True)
+    return os.path.join(local_dir, os.path.basename(index))
+
+
+def claim_unit(queue: str, worker_id: str, requeue_after: float) -> tuple:
+    """
+    Claims the next pending unit of the queue by moving it to 'claimed'.
+    Claimed units whose worker has not finished them for requeue_after
+    seconds are pending again, e.g. after the node has been preempted.
+    :param queue: directory of the queue
+    :param worker_id: unique id of the claiming worker
+    :param requeue_after: seconds after which a claim is given up, never if 0
+    :return: tuple of the name of the unit and the path of the claimed file or
+    None if no unit is pending
+    """
+    if requeue_after:
+        claimed_dir = os.path.join(queue, 'claimed')
+        for claim in os.listdir(claimed_dir):
+            path = os.path.join(claimed_dir, claim)
+            try:
+                if time.time() - os.path.getmtime(path) > requeue_after:
+                    os.rename(path, os.path.join(
+                        queue, 'pending', claim.partition(QUEUE_CLAIM_SEP)[0]))
+                    logging.warning('Requeued stale unit {}'.format(claim))
+            except OSError:
+                continue
+    for unit in sorted(os.listdir(os.path.join(queue, 'pending'))):
+        claim = os.path.join(queue, 'claimed',
+                             unit + QUEUE_CLAIM_SEP + worker_id)
+        try:
+            # rename is atomic, so only one worker can claim a unit
+            os.rename(os.path.join(queue, 'pending', unit), claim)
+        except OSError:
+            continue
+        os.utime(claim)
+        return unit, claim
+    return None
+
+
+def queue_worker(queue: str, local_cache: str, requeue_after: float,
+                 wait: bool):
+    """
+    Processes units of a queue until none is pending. Every unit is processed
+    by a separate run of genuprimer against a local copy of the index, its
+    results are written to 'results'.
+    :param queue: directory of the queue
+    :param local_cache: local directory holding the copied indexes
+    :param requeue_after: seconds after which a claim is given up, never if 0
+    :param wait: whether to wait for units claimed by other workers, which
+    might be requeued, instead of stopping once no unit is pending
+    """
+    with open(os.path.join(queue, QUEUE_DESCRIPTION)) as queue_file:
+        description = json.load(queue_file)
+    worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+    index = cache_index_locally(description['index'], local_cache)
+    while True:
+        claimed = claim_unit(queue, worker_id, requeue_after)
+        if claimed is None:
+            if wait and os.listdir(os.path.join(queue, 'claimed')):
+                time.sleep(QUEUE_POLL_INTERVAL)
+                continue
+            break
+        unit, claim = claimed
+        with open(claim) as unit_file:
+            target = json.load(unit_file)['target']
+        name = unit.rsplit('.', 1)[0]
+        result = os.path.join(queue, 'results', name + '.csv')
+        tmp_result = '{}.{}.tmp'.format(result, worker_id)
+        args = [sys.executable, os.path.abspath(__file__),
+                description['fasta'], '-s', target, '-i', index,
+                '-o', tmp_result, '--no-primerfiles'] + \
+            description['options']
+        logging.info('Worker {} processing {} for target {}'.format(
+            worker_id, unit, target))
+        with open(os.path.join(queue, 'results', name + '.log'),
+                  'w') as log:
+            returncode = run_claimed_unit(args, claim, requeue_after, log)
+        try:
+            # the claim is moved first, a unit lost in the meantime is
+            # processed by another worker and its result is not needed
+            if returncode == 0:
+                os.rename(claim, os.path.join(queue, 'done', unit))
+                os.replace(tmp_result, result)
+                continue
+            os.rename(claim, os.path.join(queue, 'failed', unit))
+            logging.warning('Unit {} for target {} failed, see {}'.format(
+                unit, target, os.path.join(queue, 'results', name + '.log')))
+        except FileNotFoundError:
+            logging.warning('Unit {} has been requeued while worker {} '
+                            'processed it, discarding its result'.format(
+                                unit, worker_id))
+        if os.path.exists(tmp_result):
+            os.remove(tmp_result)
+
+
+def run_claimed_unit(args: list, claim: str, requeue_after: float,
+                     log: '_io.TextIOWrapper'):
+    """
+    Runs genuprimer for a claimed unit and refreshes the modification time of
+    the claim while it is running, so the unit is not requeued by other
+    workers. If the claim vanishes nevertheless, the run is stopped.
+    :param args: command line of the run
+    :param claim: path of the claimed unit
+    :param requeue_after: seconds after which a claim is given up, never if 0
+    :param log: file the output of the run is written to
+    :return: exit status of the run, None if the claim has been lost
+    """
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=log)
+    # refresh well before other workers consider the claim stale
+    interval = min(QUEUE_POLL_INTERVAL, requeue_after / 3) \
+        if requeue_after else None
+    while True:
+        try:
+            return process.wait(interval)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            os.utime(claim)
+        except FileNotFoundError:
+            process.kill()
+            process.wait()
+            return None
+
+
+def queue_merge(queue: str, output: '_io.TextIOWrapper'):
+    """
+    Merges the results of all finished units into the normal CSV format.
+    :param queue: directory of the queue
+    :param output: Opened file or STDOUT where the results are written to
+    """
+    for state in ('pending', 'claimed', 'failed'):
+        units = os.listdir(os.path.join(queue, state))
+        if units:
+            logging.warning('{} units are {}, their results are '
+                            'missing'.format(len(units), state))
+    header = None
+    for unit in sorted(os.listdir(os.path.join(queue, 'done'))):
+        result = os.path.join(queue, 'results',
+                              unit.rsplit('.', 1)[0] + '.csv')
+        with open(result) as result_file:
+            # only the header of the first partial result is kept, it
+            # depends on the options, e.g. --amplicon-info
+            unit_header = next(result_file, RESULT_HEADER + '\n')
+            if header is None:
+                header = unit_header
+                output.write(header)
+            shutil.copyfileobj(result_file, output)
+    if header is None:
+        output.write(RESULT_HEADER + '\n')
+    output.flush()
+
+
+def run_queue(argv: list):
+    """
+    Dispatches the commands of a work queue, invoked via
+    'genuprimer.py --queue'.
+    :param argv: command line arguments following '--queue'
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} --queue'.format(os.path.basename(sys.argv[0])),
+        description=arg_queue_description)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    init = commands.add_parser(
+        'init', help='Create a queue with one unit per target sequence',
+        epilog='Options of genuprimer following -- are passed to every run '
+               'processing a unit.')
+    init.add_argument('queue', help='directory of the queue')
+    init.add_argument('fasta_file', metavar='path_to_fasta_file',
+                      help=arg_fasta_file_help)
+    init.add_argument('-t', '--target', dest='targets', action='append',
+                      default=[], metavar='seq_id',
+                      help='Target sequence, may be repeated (default: '
+                           'every sequence of path_to_fasta_file)')
+    init.add_argument('-i', '--index', help='Existing bowtie index of '
+                                            'path_to_fasta_file')
+    init.add_argument('--bowtie', default='bowtie', help=arg_bowtie_help)
+    worker_options = argparse.ArgumentParser(add_help=False)
+    worker_options.add_argument('queue', help='directory of the queue')
+    worker_options.add_argument(
+        '--local-cache', dest='local_cache',
+        default=os.path.join(tempfile.gettempdir(), 'genuprimer-index-cache'),
+        help='Local directory the index is copied to (default: %(default)s)')
+    worker_options.add_argument(
+        '--requeue-after', dest='requeue_after', type=float, default=0,
+        metavar='seconds', help='Give up claims of other workers after this '
+                                'many seconds (default: never)')
+    worker_options.add_argument(
+        '--wait', action='store_true', help='Wait for units claimed by other '
+                                            'workers instead of stopping')
+    commands.add_parser('worker', parents=[worker_options],
+                        help='Process units until none is pending')
+    run = commands.add_parser(
+        'run', parents=[worker_options],
+        help='Process all units by local workers and merge their results')
+    run.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                     help='Number of local workers (default: %(default)s)')
+    merge = commands.add_parser(
+        'merge', help='Merge the results of all finished units')
+    merge.add_argument('queue', help='directory of the queue')
+    for merging_parser in (run, merge):
+        merging_parser.add_argument(
+            '-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
+            help=arg_output_help)
+    # options following -- are passed to genuprimer and not parsed here
+    options = []  # type: list
+    if '--' in argv:
+        options = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+
+    if args.command == 'init':
+        queue_init(args.queue, args.fasta_file, args.targets, args.index,
+                   args.bowtie, options)
+        return
+    if not os.path.isfile(os.path.join(args.queue, QUEUE_DESCRIPTION)):
+        logging.error('{} is no queue created via init'.format(args.queue))
+        sys.exit(1)
+    if args.command == 'worker':
+        queue_worker(args.queue, args.local_cache, args.requeue_after,
+                     args.wait)
+    elif args.command == 'run':
+        worker_args = [sys.executable, os.path.abspath(__file__), '--queue',
+                       'worker', args.queue, '--local-cache', args.local_cache,
+                       '--requeue-after', str(args.requeue_after)]
+        workers = [subprocess.Popen(worker_args)
+                   for _ in range(max(1, args.workers))]
+        for worker in workers:
+            worker.wait()
+        queue_merge(args.queue, args.output)
+    else:
+        queue_merge(args.queue, args.output)
+
+
+def build_fasta_index(fasta_file_location: str) -> str:
+    """
+    Creates an index of an uncompressed FASTA file in the format of
+    'samtools faidx': one line per record with its id, length, offset of its
+    sequence, bases per line and bytes per line. An existing index is kept
+    unless the FASTA file has been changed since.
+    :param fasta_file_location: path to the fasta file
+    :return: path of the index
+    """
+    index_file = fasta_file_location + FASTA_INDEX_SUFFIX
+    try:
+        if os.path.getmtime(index_file) >= \
+                os.path.getmtime(fasta_file_location):
+            return index_file
+    except OSError:
+        pass
+    with open(fasta_file_location, 'rb') as fasta:
+        if fasta.read(2) == GZIP_MAGIC:
+            logging.error('Amplicons can only be extracted from uncompressed '
+                          'FASTA files, please decompress {}. '
+                          'Aborting'.format(fasta_file_location))
+            sys.exit(1)
+        fasta.seek(0)
+        entries = []
+        offset = 0
+        for line in fasta:
+            if line[:1] == b'>':
+                # id, length, offset, bases per line, bytes per line
+                entries.append([fasta_id(line[1:].decode('utf-8')), 0,
+                                offset + len(line), 0, 0])
+            elif entries and line.strip():
+                entry = entries[-1]
+                bases = len(line.rstrip(b'\r\n'))
+                if entry[3] == 0:
+                    entry[3], entry[4] = bases, len(line)
+                elif entry[1] % entry[3] or bases > entry[3]:
+                    logging.error('Lines of record {} in {} differ in length, '
+                                  'cannot index it. Aborting'.format(
+                                      entry[0], fasta_file_location))
+                    sys.exit(1)
+                entry[1] += bases
+            offset += len(line)
+    tmp_file = '{}.{}.tmp'.format(index_file, os.getpid())
+    with open(tmp_file, 'w') as index:
+        for entry in entries:
+            index.write('\t'.join(map(str, entry)) + '\n')
+    os.replace(tmp_file, index_file)
+    logging.info('Created index {} of {} records'.format(index_file,
+                                                          len(entries)))
+    return index_file
+
+
+def open_indexed_fasta(fasta_file_location: str) -> tuple:
+    """
+    Opens a FASTA file for random access to its sequences via its index,
+    see build_fasta_index. The file is memory mapped, so only the requested
+    parts are read.
+    :param fasta_file_location: path to the fasta file
+    :return: tuple of the index, mapping every id to its entry, and the
+    memory mapped file
+    """
+    fasta_index = {}
+    with open(build_fasta_index(fasta_file_location)) as index:
+        for line in index:
+            name, length, offset, line_bases, line_width = \
+                line.rstrip('\n').split('\t')[:5]
+            fasta_index[name] = (int(length), int(offset), int(line_bases),
+                                 int(line_width))
+    with open(fasta_file_location, 'rb') as fasta:
+        mapped = mmap.mmap(fasta.fileno(), 0, access=mmap.ACCESS_READ)
+    return fasta_index, mapped
+
+
+def fetch_sequence(mapped: mmap.mmap, entry: tuple, begin: int,
+                   end: int) -> str:
+    """
+    Reads a part of a record of an indexed FASTA file.
+    :param mapped: memory mapped FASTA file, see open_indexed_fasta
+    :param entry: entry of the record inside the index
+    :param begin: 0-based position of the first base
+    :param end: 0-based position following the last base
+    :return: upper case sequence, shorter if it exceeds the record
+    """
+    length, offset, line_bases, line_width = entry
+    begin, end = max(0, begin), min(length, end)
+    if begin >= end:
+        return ''
+    first = offset + begin // line_bases * line_width + begin % line_bases
+    last = offset + end // line_bases * line_width + end % line_bases
+    return mapped[first:last].translate(None, b'\r\n').decode(
+        'ascii').upper()
+
+
+def amplicon_tm(gc_content: float, length: int, salt: float) -> float:
+    """
+    Calculates the melting temperature of an amplicon via the salt adjusted
+    formula Tm = 81.5 + 16.6 log10([Na+]) + 0.41 %GC - 675 / length.
+    :param gc_content: percentage of G and C
+    :param length: number of bases
+    :param salt: concentration of monovalent cations in mM
+    :return: melting temperature in degree Celsius
+    """
+    return 81.5 + 16.6 * math.log10(salt / 1000) + 0.41 * gc_content - \
+        675 / length
+
+
+def add_amplicon_info(pair_matches: list, fasta_index: dict,
+                      mapped: mmap.mmap) -> list:
+    """
+    Appends the sequence of the amplicon, its GC content and its melting
+    temperature to every result. The positions of the amplicons of all given
+    pairs are collected and sorted first, so the FASTA file is read
+    sequentially once.
+    :param pair_matches: list of the results of every pair, see RESULT_HEADER
+    :param fasta_index: index of the FASTA file, see open_indexed_fasta
+    :param mapped: memory mapped FASTA file
+    :return: list of the extended results of every pair in the same order
+    """
+    salt = primer3_options.get('PRIMER_SALT_MONOVALENT',
+                               DEFAULT_SALT_MONOVALENT)
+    spans = []
+    for pair, matches in enumerate(pair_matches):
+        for i, res in enumerate(matches):
+            entry = fasta_index.get(res[2])
+            if entry is None:
+                continue
+            length = abs(res[7])
+            if res[7] >= 0:
+                begin = res[5] - 1
+            else:
+                # forward primer on the reverse strand, the amplicon starts
+                # at the reverse primer
+                begin = res[6] - len(res[4]) - 1
+            spans.append((entry[1] + begin, pair, i, entry, begin,
+                          begin + length))
+    amplicons = [[''] * len(matches) for matches in pair_matches]
+    for _, pair, i, entry, begin, end in sorted(spans):
+        amplicon = fetch_sequence(mapped, entry, begin, end)
+        if pair_matches[pair][i][7] < 0:
+            amplicon = reverse_complement(amplicon)
+        amplicons[pair][i] = amplicon
+    extended = []
+    for matches, pair_amplicons in zip(pair_matches, amplicons):
+        extended.append([])
+        for res, amplicon in zip(matches, pair_amplicons):
+            if amplicon:
+                gc_content = 100.0 * (amplicon.count('G') +
+                                      amplicon.count('C')) / len(amplicon)
+                tm = amplicon_tm(gc_content, len(amplicon), salt)
+                extended[-1].append(res + (amplicon, round(gc_content, 2),
+                                           round(tm, 2)))
+            else:
+                extended[-1].append(res + ('', float('nan'), float('nan')))
+    return extended
+
+
+def result_filter_settings() -> tuple:
+    """
+    Returns the settings of the optional filters of hits, which are part of
+    the keys of stored results.
+    :return: tuple of the threshold of the thermodynamic filter, None if it is
+    not used, and whether overlapping hits are merged
+    """
+    max_dg = None
+    if runtime_parameters['thermo_filter']:
+        max_dg = runtime_parameters['thermo_max_dg']
+    return max_dg, runtime_parameters['merge_overlapping']
+
+
+def merge_overlapping_hits(matches: list) -> list:
+    """
+    Merges overlapping amplicons of a pair on the same strand of the same
+    sequence into one hit. The amplicons of every sequence and strand are kept
+    in arrays of their begin and end which are sorted and swept once.
+    :param matches: results of a pair, see RESULT_HEADER
+    :return: list of the remaining results in their original order, every
+    merged site is represented by an expected hit if there is one, otherwise
+    by its first hit
+    """
+    groups = {}  # type: dict
+    for i, res in enumerate(matches):
+        # the sign of the length is the strand the forward primer binds to
+        begin = res[5] if res[7] >= 0 else res[6] - len(res[4])
+        begins, ends, indices = groups.setdefault(
+            (res[2], res[7] >= 0),
+            (array.array('q'), array.array('q'), array.array('q')))
+        begins.append(begin)
+        ends.append(begin + abs(res[7]))
+        indices.append(i)
+    kept = []
+    for begins, ends, indices in groups.values():
+        order = sorted(range(len(begins)), key=begins.__getitem__)
+        site_end = None
+        for j in order:
+            i = indices[j]
+            if site_end is not None and begins[j] < site_end:
+                # overlaps the current site
+                site_end = max(site_end, ends[j])
+                if matches[i][8] and not matches[kept[-1]][8]:
+                    kept[-1] = i
+                continue
+            site_end = ends[j]
+            kept.append(i)
+    return [matches[i] for i in sorted(kept)]
+
+
+def binding_sites(matches: list, fasta_index: dict, mapped: mmap.mmap) -> list:
+    """
+    Reads the sequences the forward and the reverse primer of every hit bind
+    to. The sites are read in the order of their position inside the FASTA
+    file.
+    :param matches: results of a pair, see RESULT_HEADER
+    :param fasta_index: index of the FASTA file, see open_indexed_fasta
+    :param mapped: memory mapped FASTA file
+    :return: list of tuples of the forward and the reverse primer each
+    followed by the sequence it binds to, written 5' to 3', None for hits
+    whose sequence is not part of the index or with degenerate primer
+    """
+    reads = []
+    for i, res in enumerate(matches):
+        entry = fasta_index.get(res[2])
+        if entry is None or set(res[3] + res[4]) - set('ACGT'):
+            continue
+        fwd_begin, rev_begin = res[5] - 1, res[6] - len(res[4]) - 1
+        # the sign of the length is the strand the forward primer binds to
+        reversed_fwd = res[7] < 0
+        reads.append((entry[1] + fwd_begin, i, 0, entry, fwd_begin,
+                      len(res[3]), reversed_fwd))
+        reads.append((entry[1] + rev_begin, i, 1, entry, rev_begin,
+                      len(res[4]), not reversed_fwd))
+    sites = [[None, None] for _ in matches]
+    for _, i, position, entry, begin, length, is_reversed in sorted(reads):
+        site = fetch_sequence(mapped, entry, begin, begin + length)
+        # a primer aligned to the reverse strand binds to the sequence itself
+        sites[i][position] = site if is_reversed else reverse_complement(site)
+    return [None if None in pair_sites else
+            ((res[3].upper(), pair_sites[0]), (res[4].upper(), pair_sites[1]))
+            for res, pair_sites in zip(matches, sites)]
+
+
+def thermo_filter_results(pair_results, fasta_file_location: str,
+                          max_dg: float, processes: int):
+    """
+    Drops unexpected hits where one of the primer binds too weak to the site
+    it has been aligned to. The delta G of every duplex of a primer and a site
+    is calculated once by primer3, batches of hits are scored in parallel.
+    :param pair_results: Iterable of tuples of the key of a pair and its
+    results, see iter_pair_results
+    :param fasta_file_location: path to the fasta file of the index
+    :param max_dg: delta G in cal/mol both primer have to reach
+    :param processes: number of processes used to score the duplexes
+    :return: Generator of tuples of the key of a pair and its remaining
+    results
+    """
+    import_primer3()
+    fasta_index, mapped = open_indexed_fasta(fasta_file_location)
+    duplex_dg = {}  # type: dict
+    dropped = 0
+
+    def filter_batch(batch: list, pool: concurrent.futures.Executor):
+        nonlocal dropped
+        sites = [binding_sites(matches, fasta_index, mapped)
+                 for _, matches in batch]
+        missing = sorted({duplex for pair_sites in sites
+                          for duplexes in pair_sites if duplexes is not None
+                          for duplex in duplexes} - duplex_dg.keys())
+        chunks = [missing[i:i + PANEL_SCORE_CHUNK_SIZE]
+                  for i in range(0, len(missing), PANEL_SCORE_CHUNK_SIZE)]
+        for chunk, scores in zip(chunks, pool.map(score_heterodimers,
+                                                  chunks)):
+            duplex_dg.update(zip(chunk, scores))
+        for (key, matches), pair_sites in zip(batch, sites):
+            kept = [res for res, duplexes in zip(matches, pair_sites)
+                    if res[8] or duplexes is None or
+                    all(duplex_dg[duplex] <= max_dg for duplex in duplexes)]
+            dropped += len(matches) - len(kept)
+            yield key, kept
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        batch = []  # type: list
+        batch_hits = 0
+        for key, matches in pair_results:
+            batch.append((key, matches))
+            batch_hits += len(matches)
+            if batch_hits >= THERMO_BATCH_SIZE:
+                yield from filter_batch(batch, pool)
+                batch, batch_hits = [], 0
+        yield from filter_batch(batch, pool)
+    logging.info('Dropped {} hits with weak binding, scored {} duplexes via '
+                 'primer3'.format(dropped, len(duplex_dg)))
+
+
+def parse_existing_primer(prefix: str) -> dict:
+    """
+    This function reads the files containing the custom primer pairs and stores
+    them in the same way newly generated would be stored. Only complete pairs
+    are stored. If one file contains m and the other n sequences, given n < m
+    only n pairs would be returned and the m-n discarded.
+    :param prefix: Prefix for files containing the primer, expected to be
+    readable from prefix_{left,right}.fas
+    :return: Dictionary containing all primer, accessible via sorted
+    concatenation of their names
+    """
+    left_name = "{}_left.fas".format(prefix)
+    right_name = "{}_right.fas".format(prefix)
+    primer_dict = {}  # type: dict
+    try:
+        # both files are read lazily record by record
+        for (l_header, l_seq), (r_header, r_seq) in zip(
+                iter_fasta(left_name), iter_fasta(right_name)):
+            l_id, r_id = fasta_id(l_header), fasta_id(r_header)
+            logging.debug('Extracted primer pair from {} and {}: {}'.format(
+                left_name, right_name, ((l_id, l_seq), (r_id, r_seq))))
+            primer_dict.update({tuple(sorted((l_id, r_id))): (l_seq, r_seq)})
+            primer_pair_ids.update({tuple(sorted((l_id, r_id))): (l_id, r_id)})
+            # the target of a pair and the region on it may be annotated as
+            # 'target=' and 'region=' inside the header of the forward primer
+            for word in l_header.split()[1:]:
+                if word.startswith('target='):
+                    primer_pair_info.setdefault(tuple(sorted((l_id, r_id))),
+                                                {})['target'] = word[7:]
+                elif word.startswith('region='):
+                    begin, _, end = word[7:].partition('-')
+                    if not begin.isdigit() or not end.isdigit() or \
+                            int(begin) > int(end):
+                        logging.error('Invalid region {} of primer {}, '
+                                      'expected region=BEGIN-END. '
+                                      'Aborting'.format(word[7:], l_id))
+                        sys.exit(1)
+                    primer_pair_info.setdefault(tuple(sorted((l_id, r_id))),
+                                                {})['region'] = \
+                        (int(begin), int(end))
+    except OSError:
+        logging.error(
+            'Could not find or read one or both of the files '
+            'containing the primers that should be used for this run '
+            'instead of generating new one.\n'
+            'Looking for files: {} and {}. Aborting'.format(
+                left_name, right_name
+            ))
+        sys.exit(1)
+    return primer_dict
+
+
+def degenerate_variants(sequence: str, max_variants: int,
+                        three_prime_length: int) -> list:
+    """
+    Expands a primer containing IUPAC codes into concrete sequences. Only the
+    last bases decide whether a hit is significant, see parse_bowtie_result,
+    therefore only one variant per equivalence class of the 3'-end is kept,
+    all of them share the first expansion of the 5'-end.
+    :param sequence: primer, possibly with IUPAC codes
+    :param max_variants: maximal number of returned variants
+    :param three_prime_length: number of bases at the 3'-end defining the
+    equivalence classes, i.e. LAST_TO_CHECK
+    :return: list of variants, only the sequence itself if it is not
+    degenerate
+    """
+    choices = [IUPAC_BASES.get(base, base) for base in sequence.upper()]
+    split = max(0, len(choices) - three_prime_length)
+    five_prime_end = ''.join(bases[0] for bases in choices[:split])
+    # the product is enumerated lazily, so huge expansions are never built
+    return [five_prime_end + ''.join(three_prime_end)
+            for three_prime_end in itertools.islice(
+                itertools.product(*choices[split:]), max_variants)]
+
+
+def interleaved_pairs(first: list, second: list):
+    """
+    Enumerates all pairs of the elements of two lists ordered by the sum of
+    their positions, so the first pairs already combine different elements of
+    both lists.
+    :param first: list of the first elements
+    :param second: list of the second elements
+    :return: Generator of tuples of one element of each list
+    """
+    for total in range(len(first) + len(second) - 1):
+        for position in range(max(0, total - len(second) + 1),
+                              min(total + 1, len(first))):
+            yield first[position], second[total - position]
+
+
+def expand_degenerate_primer(primer_dict: dict, max_variants: int) -> tuple:
+    """
+    Replaces all pairs with degenerate primer by pairs of their variants, at
+    most max_variants per pair. A pair of variants shared by several pairs is
+    aligned only once.
+    :param primer_dict: Dictionary containing all primer pairs
+    :param max_variants: maximal number of pairs of variants of every pair
+    :return: tuple of the dictionary passed to bowtie and a dictionary
+    mapping the keys of the variant pairs to the keys of their original pairs
+    """
+    bowtie_primer = {}  # type: dict
+    variant_keys = {}  # type: dict
+    variant_origin = {}  # type: dict
+    for key, (fwd, rev) in primer_dict.items():
+        # more variants of one primer than pairs are never combined
+        variants = [degenerate_variants(primer, max_variants + 1,
+                                        bowtie_parse_options['LAST_TO_CHECK'])
+                    for primer in (fwd, rev)]
+        if variants == [[fwd], [rev]]:
+            bowtie_primer[key] = (fwd, rev)
+            continue
+        pairs = list(itertools.islice(interleaved_pairs(*variants),
+                                      max_variants + 1))
+        if len(pairs) > max_variants:
+            pairs.pop()
+            logging.warning('Degenerate pair {} has more than {} pairs of '
+                            'variants with different 3\'-ends, only {} are '
+                            'checked'.format(key, max_variants, len(pairs)))
+        for pair in pairs:
+            if pair not in variant_keys:
+                ids = ('VARIANT_{}_FWD'.format(len(variant_keys)),
+                       'VARIANT_{}_REV'.format(len(variant_keys)))
+                variant_keys[pair] = tuple(sorted(ids))
+                primer_pair_ids[variant_keys[pair]] = ids
+                bowtie_primer[variant_keys[pair]] = pair
+            variant_origin.setdefault(variant_keys[pair], []).append(key)
+    if variant_origin:
+        logging.info('Expanded degenerate primer to {} unique pairs of '
+                     'variants'.format(len(variant_origin)))
+    return bowtie_primer, variant_origin
+
+
+def fold_variant_records(bowtie_result, variant_origin: dict):
+    """
+    Reports the hits of variants of degenerate primer as hits of their
+    original pairs.
+    :param bowtie_result: iterable of tuples of SAM records, see run_bowtie
+    :param variant_origin: keys of the original pairs of every pair of
+    variants, see expand_degenerate_primer
+    :return: Generator of tuples of SAM records
+    """
+    for left_record, right_record in bowtie_result:
+        origins = variant_origin.get(tuple(sorted(
+            (left_record[SAM_QNAME], right_record[SAM_QNAME]))))
+        if origins is None:
+            yield left_record, right_record
+            continue
+        for origin in origins:
+            fwd_id, rev_id = pair_ids(origin)
+            yield ((fwd_id,) + tuple(left_record[1:]),
+                   (rev_id,) + tuple(right_record[1:]))
+
+
+def merge_variant_results(pair_results, variant_origin: dict):
+    """
+    Collects the results of all variants of a pair, hits found by several
+    variants are reported once. Only pairs with variants are kept until all
+    results have been read, the results of all other pairs are passed on
+    immediately.
+    :param pair_results: Iterable of tuples of the key of a pair and its
+    results, see iter_pair_results
+    :param variant_origin: keys of the original pairs of every pair of
+    variants, see expand_degenerate_primer
+    :return: Generator of tuples of the key of a pair and its results
+    """
+    degenerate = set(itertools.chain.from_iterable(variant_origin.values()))
+    merged = {}  # type: dict
+    for key, matches in pair_results:
+        if key not in degenerate:
+            yield key, matches
+            continue
+        merged.setdefault(key, {}).update(dict.fromkeys(matches))
+    for key, matches in merged.items():
+        yield key, list(matches)
+
+
+def open_fasta(fasta_file) -> io.TextIOBase:
+    """
+    Opens a FASTA file for reading, files compressed with gzip or bgzip are
+    detected by their magic number and decompressed on the fly.
+    :param fasta_file: Either the path to the file or an already opened file
+    :return: Text stream of the (decompressed) content
+    """
+    if isinstance(fasta_file, str):
+        with open(fasta_file, 'rb') as raw:
+            magic = raw.read(2)
+        if magic == GZIP_MAGIC:
+            return gzip.open(fasta_file, 'rt')
+        return open(fasta_file, 'r')
+    raw = getattr(fasta_file, 'buffer', None)
+    if raw is not None and hasattr(raw, 'peek') and \
+            raw.peek(2)[:2] == GZIP_MAGIC:
+        # bgzip files are valid multi-member gzip files
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=raw))
+    return fasta_file
+
+
+def iter_fasta(fasta_file, chunk_size: int = FASTA_CHUNK_SIZE):
+    """
+    Lazily iterates over all records of a FASTA file. The file is read in
+    chunks and the lines of a sequence are joined once the record is complete,
+    so arbitrary large files are parsed in linear time.
+    :param fasta_file: Either the path to the file or an already opened file,
+    which may be compressed via gzip or bgzip
+    :param chunk_size: number of characters read at once
+    :return: Generator of tuples consisting of the header without leading '>'
+    and the sequence sanitized from newlines
+    """
+    stream = open_fasta(fasta_file)
+    header = None
+    sequence = []  # type: list
+    # beginning of a line which has not been completed by the last chunk
+    line_start = []  # type: list
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            lines = chunk.split('\n')
+            if len(lines) == 1:
+                line_start.append(chunk)
+                continue
+            lines[0] = ''.join(line_start) + lines[0]
+            line_start = [lines.pop()]
+            for line in lines:
+                if line[:1] == '>':
+                    if header is not None:
+                        yield header, ''.join(sequence)
+                    header = line[1:].strip()
+                    sequence = []
+                elif header is not None:
+                    sequence.append(line.strip())
+        # handle the last line which is not terminated by a newline
+        line = ''.join(line_start)
+        if line[:1] == '>':
+            if header is not None:
+                yield header, ''.join(sequence)
+            header = line[1:].strip()
+            sequence = []
+        elif header is not None:
+            sequence.append(line.strip())
+        if header is not None:
+            yield header, ''.join(sequence)
+    finally:
+        if stream is not fasta_file:
+            stream.close()
+
+
+def fasta_id(header: str) -> str:
+    """
+    Extracts the id of a sequence from its FASTA header.
+    :param header: header without leading '>'
+    :return: first word of the header
+    """
+    return header.split(maxsplit=1)[0] if header.strip() else ''
+
+
+def extract_included_region(config: configparser.SectionProxy) -> tuple:
+    """
+    This functions extracts the region for which primer shall be generated
+    from the config file.
+    :param config: contains the values.
+    :return: extracted values formatted as int
+    """
+    if config is not None:
+        seq_begin = config.getint('SEQUENCE_INCLUDED_BEGIN', -1)
+        seq_end = config.getint('SEQUENCE_INCLUDED_END', -1)
+    else:
+        seq_begin = 0
+        seq_end = 0
+    # is one of the values invalid?
+    if seq_begin < 0 or seq_end < 0:
+        logging.error(
+            ('Found negative or invalid values for the region'
+             'for which the primer will be generated or have been generated if '
+             'custom primers are used via --keep-primer.'
+             '(SEQUENCE_INCLUDED_BEGIN,SEQUENCE_INCLUDED_END)'
+             ' = {}. If you want to generate primers for the '
+             'whole sequence set both values to 0. Aborting').format(
+                (config['SEQUENCE_INCLUDED_BEGIN'],
+                 config['SEQUENCE_INCLUDED_END']))
+        )
+        sys.exit(1)
+    return seq_begin, seq_end
+
+
+def pair_expectation(key: tuple, seq_included_region: tuple,
+                     seq_id: str) -> tuple:
+    """
+    Returns the region and the sequence a hit of a pair is expected in. Pairs
+    of tiled windows have their own region on the sequence of the run. Pairs
+    annotated with a target via --keep-primer are expected on their target,
+    inside the annotated region or anywhere if no region has been annotated.
+    :param key: key of the pair inside primer_dict
+    :param seq_included_region: region used for pairs without own region
+    :param seq_id: sequence used for pairs without own target
+    :return: tuple of the region and the id or prefix of the sequence
+    """
+    info = primer_pair_info.get(key, {})
+    if 'target' in info:
+        return info.get('region', (0, sys.maxsize)), info['target']
+    return info.get('region', seq_included_region), seq_id
+
+
+def parse_bowtie_result(primer_tuple: tuple,
+                        primer_dict: dict,
+                        seq_included_region: tuple,
+                        additional_fasta: bool,
+                        seq_id: str,
+                        keep_primer: bool) -> tuple:
+    """
+    Parses the bowtie result and presents them in a csv-style containing
+    the most important information.
+    :param primer_tuple: Current tuple of the SAM records (forward and reverse)
+    which bowtie results are now checked, see parse_sam_line.
+    :param primer_dict: Dictionary containing all primer pairs, accessible via
+    sorted concatenation of fwd-primer-id and rev-primer-id.
+    :param seq_included_region: Start and stop of the region for which the
+    primer have been generated.
+    :param additional_fasta: Whether the extracted sequence's origin is an
+    additional file not indexed by bowtie.
+    :param seq_id: The whole id of the sequence for which primer have been
+    generated or a prefix defined by user if custom primer are used.
+    :param keep_primer: Whether custom primer pairs were read from files and
+    no new ones were generated.
+    :param seq_included_region: Tuple of the specified region for which primer
+    have been produced; used to check whether a match reported by bowtie is
+    expected or not
+    :return tuple of key and result for this key, where the key is the same from
+    primer_dict and the result a tuple of the values described by RESULT_HEADER
+    """
+
+    def is_significant(values):
+        # if last entry is a number it represents the number of matches at
+        # the end of the primer; must not be lower than given value
+        if values[-1].isdigit():
+            if int(values[-1]) < bowtie_parse_options['LAST_MUST_MATCH']:
+                # only enable line below if you really want to understand
+                # the process
                 # logging.debug(
                 #     'Failed because last_must_match not fulfilled: {}'.format(
                 #         values))
@@ -706,21 +2688,17 @@ def parse_bowtie_result(primer_tuple: tuple,
                 ))
         return number_of_subs < bowtie_parse_options['LAST_MAX_ERROR']
 
-    # if bowtie result line is so short it means no hit has been found
+    left_record, right_record = primer_tuple
+    # records without mismatch string describe reads without any hit
     # and obviously a non existent match cannot be significant
-    if len(primer_tuple[0].split()) <= 12 or len(primer_tuple[1].split()) <= 12:
-        # if bowtie result line is so short it means no hit has been found
-        # and obviously a non existent match cannot be significant
+    if left_record[SAM_MD] is None or right_record[SAM_MD] is None:
         return None, None
-    # split bowtie results for forward and reverse primer of one pair
-    [left_split, right_split] = list(map(str.split, primer_tuple))
-    # get string representation of mismatch bases
-    left_match, right_match = left_split[12], right_split[12]
     # get id of each primer pair
-    left_name, right_name = left_split[0], right_split[0]
-    # split numerical and alphabetic values
-    left_res = re.split('(\d+)', left_match.split(':')[2])
-    right_res = re.split('(\d+)', right_match.split(':')[2])
+    left_name, right_name = left_record[SAM_QNAME], right_record[SAM_QNAME]
+    # split numerical and alphabetic values of the string representation of
+    # mismatch bases
+    left_res = re.split('(\d+)', left_record[SAM_MD])
+    right_res = re.split('(\d+)', right_record[SAM_MD])
 
     def remove_empty_mismatch(x):
         """
@@ -740,13 +2718,22 @@ def parse_bowtie_result(primer_tuple: tuple,
     # preferences
     if is_significant(left_res) and is_significant(right_res):
         # extract information from one of the results
-        infos = left_split
+        infos = left_record
         # generate key for dictionary containing all primer
         # for current bowtie results
         current_dict_key = tuple(sorted((left_name, right_name)))
         # get current sequences
         current_pair = primer_dict.get(current_dict_key)
+        if current_pair is None:
+            # pair has been dropped after it has been passed to bowtie
+            return None, None
 
+        # pairs of tiled regions or panel targets have their own region
+        seq_included_region, seq_id = pair_expectation(
+            current_dict_key, seq_included_region, seq_id)
+        # a hit on the representative of identical records is a hit on all
+        reference_names = reference_members.get(infos[SAM_RNAME],
+                                                (infos[SAM_RNAME],))
         if keep_primer:
             """
             Primer have not been generated by us but user has been warned that
@@ -758,9 +2745,9 @@ def parse_bowtie_result(primer_tuple: tuple,
             We therefore look whether the given id is a prefix of the reported
             id.
             """
-            expected_hit = seq_included_region[0] <= int(infos[3]) <= int(
-                infos[7]) <= seq_included_region[1] and infos[2].startswith(
-                seq_id)
+            expected_hit = seq_included_region[0] <= infos[SAM_POS] <= \
+                infos[SAM_PNEXT] <= seq_included_region[1] and \
+                any(name.startswith(seq_id) for name in reference_names)
         else:
             """
             A match is expected if its start and end position are inside
@@ -768,21 +2755,18 @@ def parse_bowtie_result(primer_tuple: tuple,
             the id of the sequence where the match was found is the
             same as the one for which the primer were generated.
             """
-            expected_hit = seq_included_region[0] <= int(infos[3]) <= int(
-                infos[7]) <= seq_included_region[1] and infos[2] == seq_id
-
-        # format results to result format
-        res = ('{fwd}{sep}{rev}{sep}{gi}{sep}{left_primer}{sep}{right_primer}'
-               '{sep}{start}{sep}{stop}{sep}{size}{sep}{exp}').format(
-            fwd=left_name, rev=right_name, sep=',', gi=infos[2],
-            left_primer=current_pair[0],
-            right_primer=current_pair[1], start=infos[3],
-            # bowtie sets stop to the first of the rev primer, but we want to
-            # the length of the whole region enclosed by the primer including
-            # themselves
-            stop=int(infos[7]) + len(current_pair[1]),
-            size=infos[8], exp=1 if expected_hit else 0
-        )
+            expected_hit = seq_included_region[0] <= infos[SAM_POS] <= \
+                infos[SAM_PNEXT] <= seq_included_region[1] and \
+                seq_id in reference_names
+
+        # format results to result format, see RESULT_HEADER
+        res = (left_name, right_name, infos[SAM_RNAME],
+               current_pair[0], current_pair[1], infos[SAM_POS],
+               # bowtie sets stop to the first of the rev primer, but we want
+               # to the length of the whole region enclosed by the primer
+               # including themselves
+               infos[SAM_PNEXT] + len(current_pair[1]),
+               infos[SAM_TLEN], 1 if expected_hit else 0)
         return current_dict_key, res
     else:
         return None, None
@@ -808,94 +2792,853 @@ def default_bowtie_index_location(fasta_file_name: str) -> str:
     return bowtie_index
 
 
-def setup_bowtie(index_location: str, fasta_file_location: str, debug: bool,
-                 bowtie_exec: str):
+def index_modification_time(index_location: str) -> float:
+    """
+    Returns the time of the last modification of a bowtie index, used to
+    invalidate cached bowtie results once the index has been rebuilt.
+    :param index_location: location of the index for bowtie
+    :return: modification time or 0 if it could not be determined
+    """
+    for path in (index_location + INDEX_MANIFEST_SUFFIX,
+                 index_location + '.1.ebwt'):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            continue
+    return 0
+
+
+def setup_bowtie(index_location: str, fasta_file_location: str, debug: bool,
+                 bowtie_exec: str, options: list = ()):
+    """
+    If no bowtie-index is specified we have to build it.
+    :param index_location: Either user specified location of the bowtie index
+    or the default path constructed
+    :param fasta_file_location: path to the fasta file containing the sequences
+    :param debug: whether debug logging is set on or off.
+    :param bowtie_exec: str containing the path to bowtie executable.
+    bowtie-build is supposed to be in the same folder.
+    :param options: additional options for bowtie-build
+    """
+    bowtie_index_dir = index_location.split('/')[0]
+    # create new directory for the index,
+    # no problem if specific folder already exists
+    os.makedirs(bowtie_index_dir, exist_ok=True)
+    # determine name for index from name of the
+    # FASTA-file containing the sequences
+    bowtie_build = bowtie_exec + '-build'
+    args = [bowtie_build] + list(options) + [fasta_file_location,
+                                             index_location]
+    logging.info('bowtie-build command: {}'.format(args))
+    if not debug:
+        # We are not in debug-mode so no output will be shown
+        subprocess.call(args, stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
+    else:
+        # debug-mode, show everything
+        subprocess.call(args)
+
+
+def bowtie_build_supports_threads(bowtie_build: str) -> bool:
+    """
+    Checks whether the given bowtie-build supports building an index with
+    multiple threads, which older versions do not.
+    :param bowtie_build: bowtie-build executable
+    :return: whether '--threads' is a known option
+    """
+    try:
+        usage = subprocess.run([bowtie_build, '--help'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT).stdout
+    except OSError:
+        return False
+    return b'--threads' in usage
+
+
+def load_index_manifest(index_location: str) -> dict:
+    """
+    Reads the manifest describing the shards of a sharded bowtie index.
+    :param index_location: location of the sharded index
+    :return: the manifest or an empty one if none exists so far
+    """
+    try:
+        with open(index_location + INDEX_MANIFEST_SUFFIX, 'r') as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {'version': INDEX_MANIFEST_VERSION, 'fasta': None,
+                'fasta_size': None, 'fasta_mtime': None, 'next_shard': 0,
+                'shards': []}
+
+
+def deduplicate_reference(fasta_file_location: str,
+                          index_location: str) -> str:
+    """
+    Writes one representative, the first occurrence, of every group of
+    records with identical sequences next to the index and a table of the
+    ids of the removed duplicates. Both files are only rewritten if
+    fasta_file_location has been changed since.
+    :param fasta_file_location: path to the fasta file containing the sequences
+    :param index_location: location of the index for bowtie
+    :return: path of the deduplicated fasta file
+    """
+    dedup_fasta = index_location + DEDUP_FASTA_SUFFIX
+    members_file = index_location + DEDUP_MEMBERS_SUFFIX
+    try:
+        if os.path.getmtime(members_file) >= \
+                os.path.getmtime(fasta_file_location):
+            return dedup_fasta
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(index_location) or '.', exist_ok=True)
+    representatives = {}  # type: dict
+    duplicates = 0
+    tmp_fasta = '{}.{}.tmp'.format(dedup_fasta, os.getpid())
+    tmp_members = '{}.{}.tmp'.format(members_file, os.getpid())
+    with open(tmp_fasta, 'w') as fasta, open(tmp_members, 'w') as members:
+        for header, sequence in iter_fasta(fasta_file_location):
+            digest = hashlib.sha1(sequence.upper().encode('utf-8')).digest()
+            representative = representatives.setdefault(digest,
+                                                         fasta_id(header))
+            if representative == fasta_id(header):
+                fasta.write('>{}\n{}\n'.format(header, sequence))
+            else:
+                members.write('{}\t{}\n'.format(representative,
+                                                 fasta_id(header)))
+                duplicates += 1
+    os.replace(tmp_fasta, dedup_fasta)
+    os.replace(tmp_members, members_file)
+    logging.info('Removed {} duplicates of {} distinct records from {}'.format(
+        duplicates, len(representatives), fasta_file_location))
+    return dedup_fasta
+
+
+def load_reference_members(index_location: str):
+    """
+    Reads the ids of the duplicates removed from the records of a
+    deduplicated index, see deduplicate_reference.
+    :param index_location: location of the index for bowtie
+    """
+    try:
+        with open(index_location + DEDUP_MEMBERS_SUFFIX) as members:
+            for line in members:
+                representative, member = line.rstrip('\n').split('\t')
+                reference_members.setdefault(
+                    representative, [representative]).append(member)
+    except OSError:
+        return
+    logging.info('Index {} has been deduplicated, {} records have '
+                 'duplicates'.format(index_location, len(reference_members)))
+
+
+def expand_reference_members(matches: list, seq_id: str,
+                             keep_primer: bool) -> list:
+    """
+    Reports every hit on the representative of identical records for all
+    members of the group.
+    :param matches: results of a pair, see RESULT_HEADER
+    :param seq_id: The whole id of the sequence for which primer have been
+    generated or a prefix defined by user if custom primer are used.
+    :param keep_primer: Whether custom primer pairs were read from files and
+    no new ones were generated.
+    :return: list of results
+    """
+    expanded = []
+    for res in matches:
+        # pairs of panel targets are expected on their own target
+        _, target = pair_expectation(tuple(sorted(res[:2])), (), seq_id)
+        for member in reference_members.get(res[2], (res[2],)):
+            # the hit is expected for the member which is the target only
+            expected = res[8] and (member.startswith(target) if keep_primer
+                                   else member == target)
+            expanded.append(res[:2] + (member,) + res[3:8] +
+                            (1 if expected else 0,) + res[9:])
+    return expanded
+
+
+def setup_sharded_bowtie(index_location: str, fasta_file_location: str,
+                         shard_size: int, threads: int, debug: bool,
+                         bowtie_exec: str) -> list:
+    """
+    Builds or refreshes a bowtie index which is split into shards of roughly
+    shard_size bases. Shards are built in parallel and recorded in a manifest
+    next to the index. Shards whose records have not been changed since the
+    last run are kept, records which have been added or changed are put into
+    new shards, so adding records only requires building the new shards.
+    :param index_location: location of the sharded index, prefix of the
+    manifest and all shards
+    :param fasta_file_location: path to the fasta file containing the sequences
+    :param shard_size: desired number of bases per shard
+    :param threads: number of threads available for bowtie-build
+    :param debug: whether debug logging is set on or off.
+    :param bowtie_exec: str containing the path to bowtie executable.
+    :return: list of the locations of the indexes of all shards
+    """
+    os.makedirs(os.path.dirname(index_location) or '.', exist_ok=True)
+    manifest = load_index_manifest(index_location)
+    fasta_stat = os.stat(fasta_file_location)
+    if manifest['fasta'] == os.path.abspath(fasta_file_location) and \
+            manifest['fasta_size'] == fasta_stat.st_size and \
+            manifest['fasta_mtime'] == fasta_stat.st_mtime:
+        logging.info('Sharded bowtie index {} is up to date'.format(
+            index_location))
+        return [shard['index'] for shard in manifest['shards']]
+
+    # first pass: digest of every record to find the ones already indexed
+    digests = {}  # type: dict
+    for header, sequence in iter_fasta(fasta_file_location):
+        digests[fasta_id(header)] = hashlib.sha1(
+            (header + '\n' + sequence).encode('utf-8')).hexdigest()
+    kept_shards = []
+    for shard in manifest['shards']:
+        if all(digests.get(record) == digest
+               for record, digest in shard['records']):
+            kept_shards.append(shard)
+        else:
+            logging.info('Shard {} is outdated'.format(shard['index']))
+            for index_file in glob.glob(glob.escape(shard['index']) + '.*'):
+                os.remove(index_file)
+    indexed = set(record for shard in kept_shards
+                  for record, _ in shard['records'])
+
+    # second pass: write all records which are not indexed yet to new shards
+    new_shards = []  # type: list
+    shard_fasta = None
+    for header, sequence in iter_fasta(fasta_file_location):
+        record = fasta_id(header)
+        if record in indexed:
+            continue
+        if shard_fasta is None or new_shards[-1]['size'] >= shard_size:
+            if shard_fasta is not None:
+                shard_fasta.close()
+            shard_index = '{}.shard{}'.format(index_location,
+                                              manifest['next_shard'])
+            manifest['next_shard'] += 1
+            new_shards.append({'index': shard_index, 'size': 0,
+                               'records': []})
+            shard_fasta = open(shard_index + '.fa', 'w')
+        shard_fasta.write('>{}\n{}\n'.format(header, sequence))
+        new_shards[-1]['size'] += len(sequence)
+        new_shards[-1]['records'].append((record, digests[record]))
+    if shard_fasta is not None:
+        shard_fasta.close()
+
+    if new_shards:
+        bowtie_build = bowtie_exec + '-build'
+        parallel_builds = max(1, min(threads, len(new_shards)))
+        build_threads = max(1, threads // parallel_builds)
+        options = []
+        if build_threads > 1 and bowtie_build_supports_threads(bowtie_build):
+            options = ['--threads', str(build_threads)]
+        logging.info('Building {} shards of bowtie index {}, {} at a '
+                     'time'.format(len(new_shards), index_location,
+                                   parallel_builds))
+
+        def build_shard(shard: dict):
+            setup_bowtie(shard['index'], shard['index'] + '.fa', debug,
+                         bowtie_exec, options)
+            os.remove(shard['index'] + '.fa')
+
+        with concurrent.futures.ThreadPoolExecutor(parallel_builds) as pool:
+            # consume the results to raise exceptions of the builds
+            list(pool.map(build_shard, new_shards))
+
+    manifest.update({'fasta': os.path.abspath(fasta_file_location),
+                     'fasta_size': fasta_stat.st_size,
+                     'fasta_mtime': fasta_stat.st_mtime,
+                     'shards': kept_shards + new_shards})
+    tmp_path = '{}{}.{}.tmp'.format(index_location, INDEX_MANIFEST_SUFFIX,
+                                    os.getpid())
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(tmp_path, index_location + INDEX_MANIFEST_SUFFIX)
+    return [shard['index'] for shard in manifest['shards']]
+
+
+def kmer_size() -> int:
+    """
+    Returns the length of the k-mers of the k-mer table, which matches
+    LAST_TO_CHECK as close as the size of the table allows.
+    :return: length of the k-mers
+    """
+    return min(max(bowtie_parse_options['LAST_TO_CHECK'], KMER_MIN_SIZE),
+               KMER_MAX_SIZE)
+
+
+def kmer_table_location(k: int) -> str:
+    """
+    Returns the location of the k-mer table, which is stored next to the
+    bowtie index of FastaFile.
+    :param k: length of the k-mers
+    :return: path of the table
+    """
+    index = runtime_parameters['index'] or default_bowtie_index_location(
+        runtime_parameters['fasta_file'].name)
+    return '{}.kmer{}.counts'.format(index, k)
+
+
+def count_kmers(sequence: str, k: int, counts: array.array):
+    """
+    Counts all k-mers of a sequence, k-mers containing other bases than A, C,
+    G and T are skipped. Counts saturate at the maximum of the table. numpy is
+    used if it is installed, a pure python fallback otherwise.
+    :param sequence: sequence of bases
+    :param k: length of the k-mers
+    :param counts: table of 4^k counts which are increased
+    """
+    codes = sequence.encode('ascii', 'replace').translate(BASE_CODES)
+    try:
+        import numpy
+    except ImportError:
+        mask = (1 << (2 * k)) - 1
+        code = valid = 0
+        for base in codes:
+            if base > 3:
+                code = valid = 0
+                continue
+            code = ((code << 2) | base) & mask
+            valid += 1
+            if valid >= k and counts[code] < KMER_MAX_COUNT:
+                counts[code] += 1
+        return
+    table = numpy.frombuffer(counts, dtype=numpy.uint16)
+    codes = numpy.frombuffer(codes, dtype=numpy.uint8)
+    for start in range(0, len(codes) - k + 1, KMER_CHUNK_SIZE):
+        window = codes[start:start + KMER_CHUNK_SIZE + k - 1]
+        number = len(window) - k + 1
+        values = numpy.zeros(number, dtype=numpy.uint32)
+        invalid = numpy.zeros(number, dtype=bool)
+        for offset in range(k):
+            part = window[offset:offset + number]
+            values = (values << 2) | (part & 3)
+            invalid |= part > 3
+        kmers, occurrences = numpy.unique(values[~invalid],
+                                          return_counts=True)
+        table[kmers] = numpy.minimum(
+            table[kmers].astype(numpy.int64) + occurrences, KMER_MAX_COUNT)
+
+
+def build_kmer_table(fasta_file_location: str, k: int, path: str):
+    """
+    Counts how often every k-mer occurs on both strands of all sequences of
+    the FASTA file and stores the counts in a table of 4^k unsigned 16-bit
+    integers, indexed by the 2-bit encoding of the k-mer.
+    :param fasta_file_location: path to the fasta file containing the sequences
+    :param k: length of the k-mers
+    :param path: location of the table
+    """
+    logging.info('Counting {}-mers of {}, this has to be done only '
+                 'once'.format(k, fasta_file_location))
+    counts = array.array('H', bytes(2 * 4 ** k))
+    for _, sequence in iter_fasta(fasta_file_location):
+        count_kmers(sequence, k, counts)
+        count_kmers(reverse_complement(sequence), k, counts)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as table_file:
+        table_file.write(KMER_TABLE_MAGIC + bytes([k]) + bytes(
+            KMER_TABLE_HEADER_SIZE - len(KMER_TABLE_MAGIC) - 1))
+        counts.tofile(table_file)
+    os.replace(tmp_path, path)
+    logging.info('Stored k-mer table at {}'.format(path))
+
+
+def setup_kmer_table(fasta_file_location: str) -> memoryview:
+    """
+    Loads the k-mer table of FastaFile, the table is built if it does not
+    exist yet or is older than FastaFile. The table is memory mapped, so only
+    the pages of the looked up k-mers are read.
+    :param fasta_file_location: path to the fasta file containing the sequences
+    :return: the counts of all k-mers, indexed by their 2-bit encoding
+    """
+    k = kmer_size()
+    path = kmer_table_location(k)
+    if not os.path.isfile(path) or \
+            os.path.getmtime(path) < os.path.getmtime(fasta_file_location):
+        build_kmer_table(fasta_file_location, k, path)
+    with open(path, 'rb') as table_file:
+        buf = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if buf[:len(KMER_TABLE_MAGIC)] != KMER_TABLE_MAGIC or \
+            buf[len(KMER_TABLE_MAGIC)] != k:
+        logging.error('{} is not a valid table of {}-mers. Aborting'.format(
+            path, k))
+        sys.exit(1)
+    return memoryview(buf)[KMER_TABLE_HEADER_SIZE:].cast('H')
+
+
+def kmer_count(table: memoryview, primer: str) -> int:
+    """
+    Looks up how often the 3'-end of a primer occurs inside the reference.
+    :param table: k-mer table as returned by setup_kmer_table
+    :param primer: sequence of the primer
+    :return: number of occurrences, 0 if the 3'-end could not be encoded
+    """
+    k = kmer_size()
+    code = 0
+    for base in primer[-k:].encode('ascii', 'replace').translate(BASE_CODES):
+        if base > 3:
+            return 0
+        code = (code << 2) | base
+    return table[code] if len(primer) >= k else 0
+
+
+def frequent_kmers(table: memoryview, number: int) -> dict:
+    """
+    Collects the most frequent k-mers of the reference, which are passed to
+    primer3 as mispriming library.
+    :param table: k-mer table as returned by setup_kmer_table
+    :param number: number of k-mers
+    :return: Dictionary of names and sequences of the k-mers
+    """
+    k = kmer_size()
+    library = {}
+    for code in heapq.nlargest(number, range(len(table)),
+                               key=table.__getitem__):
+        kmer = ''.join('ACGT'[(code >> (2 * (k - 1 - i))) & 3]
+                       for i in range(k))
+        library['KMER_{}_{}'.format(kmer, table[code])] = kmer
+    return library
+
+
+def reject_repetitive_primer(primer_dict: dict, table: memoryview,
+                             max_count: int) -> list:
+    """
+    Removes all pairs whose primer have a 3'-end occurring more often inside
+    the reference than allowed, such pairs would exceed
+    LIMIT_NUMBER_OF_MATCHES anyway.
+    :param primer_dict: Dictionary containing all primer pairs, modified in
+    place
+    :param table: k-mer table as returned by setup_kmer_table
+    :param max_count: maximal number of occurrences of the 3'-end
+    :return: list of the keys of the removed pairs
+    """
+    rejected = []
+    for key in list(primer_dict):
+        counts = [kmer_count(table, primer) for primer in primer_dict[key]]
+        primer_pair_info.setdefault(key, {})['kmer_counts'] = counts
+        if max(counts) > max_count:
+            logging.debug('Rejected pair {} because the 3\'-ends of its '
+                          'primer occur {} times'.format(key, counts))
+            del primer_dict[key]
+            rejected.append(key)
+    return rejected
+
+
+def run_bowtie_on_indexes(bowtie_indexes: list, primer_dict: dict,
+                          threads: int, *run_bowtie_args, batch: int = None):
+    """
+    Runs bowtie against every given index concurrently and merges the
+    results, so that all hits of one primer pair are still reported
+    consecutively.
+    :param bowtie_indexes: locations of the indexes, e.g. shards of an index
+    :param primer_dict: Dictionary containing all primer pairs in the order in
+    which they are passed to bowtie
+    :param threads: maximal number of concurrent bowtie processes
+    :param run_bowtie_args: remaining arguments of run_bowtie following the
+    index and primer_dict
+    :param batch: number of the batch of primer pairs, see run_bowtie_batched
+    :return: iterable of tuples of SAM records, see run_bowtie
+    """
+    if len(bowtie_indexes) == 1:
+        return align_index(bowtie_indexes[0], primer_dict, *run_bowtie_args,
+                           batch=batch)
+    pair_order = {key: i for i, key in enumerate(primer_dict)}
+
+    def order_of_pair(primer_tuple: tuple) -> int:
+        return pair_order.get(tuple(sorted(
+            (primer_tuple[0][SAM_QNAME], primer_tuple[1][SAM_QNAME]))), -1)
+
+    with concurrent.futures.ThreadPoolExecutor(max(1, threads)) as pool:
+        shard_results = list(pool.map(
+            lambda index: align_index(index, primer_dict, *run_bowtie_args,
+                                      batch=batch),
+            bowtie_indexes))
+    # bowtie reports the pairs of every shard in the order of the input
+    return heapq.merge(*shard_results, key=order_of_pair)
+
+
+def run_bowtie_batched(bowtie_indexes: list, primer_dict: dict,
+                       max_bytes: int, threads: int, *run_bowtie_args):
+    """
+    Passes the primer pairs to bowtie in batches, so that the results of one
+    batch fit into the given memory. The first batch is sized by
+    ESTIMATED_HITS_PER_PAIR, every following one by the number of hits per
+    pair of its predecessor.
+    :param bowtie_indexes: locations of the indexes, e.g. shards of an index
+    :param primer_dict: Dictionary containing all primer pairs
+    :param max_bytes: memory available for the results of one batch
+    :param threads: maximal number of concurrent bowtie processes
+    :param run_bowtie_args: remaining arguments of run_bowtie following the
+    index and primer_dict
+    :return: Generator of tuples of SAM records, see run_bowtie
+    """
+    keys = list(primer_dict)
+    batch_size = max(1, max_bytes // (ESTIMATED_HITS_PER_PAIR *
+                                      SAM_PAIR_RECORD_BYTES))
+    start = 0
+    for batch_number in itertools.count():
+        if start >= len(keys):
+            break
+        batch = {key: primer_dict[key]
+                 for key in keys[start:start + batch_size]}
+        start += len(batch)
+        logging.info('Passing {} of {} pairs to bowtie'.format(
+            start, len(keys)))
+        records = 0
+        for primer_tuple in run_bowtie_on_indexes(bowtie_indexes, batch,
+                                                  threads, *run_bowtie_args,
+                                                  batch=batch_number):
+            records += 1
+            yield primer_tuple
+        hits_per_pair = max(1.0, records / len(batch))
+        # grow carefully, a few pairs with many hits may follow
+        batch_size = max(1, min(2 * batch_size, int(
+            max_bytes // (hits_per_pair * SAM_PAIR_RECORD_BYTES))))
+
+
+def sort_results_on_disk(pair_results, max_bytes: int):
+    """
+    Sorts the results of all pairs by their number of matches and the key of
+    the pair, like the results kept in memory. Results exceeding the given
+    memory are sorted in parts which are written to the workspace of the run
+    and merged afterwards.
+    :param pair_results: Iterable of tuples of the key of a pair and its
+    complete results
+    :param max_bytes: memory available for results
+    :return: Generator of the results of every pair
+    """
+    runs = []
+    buffered = []  # type: list
+    buffered_bytes = 0
+
+    def spill():
+        buffered.sort(key=lambda item: item[:2])
+        run_fd, run_file = tempfile.mkstemp(suffix='.json',
+                                            prefix='results_',
+                                            dir=run_workspace())
+        with os.fdopen(run_fd, 'w') as run:
+            for item in buffered:
+                run.write(json.dumps(item) + '\n')
+        runs.append(run_file)
+        del buffered[:]
+
+    def read_run(run_file):
+        with open(run_file) as run:
+            for line in run:
+                yield json.loads(line)
+        os.remove(run_file)
+
+    for key, matches in pair_results:
+        buffered.append([len(matches), list(key), matches])
+        buffered_bytes += (len(matches) + 1) * RESULT_ROW_BYTES
+        if buffered_bytes > max_bytes:
+            spill()
+            buffered_bytes = 0
+    if not runs:
+        buffered.sort(key=lambda item: item[:2])
+        for _, _, matches in buffered:
+            yield matches
+        return
+    if buffered:
+        spill()
+    logging.info('Merging {} sorted parts of the results'.format(len(runs)))
+    for _, _, matches in heapq.merge(*map(read_run, runs),
+                                     key=lambda item: item[:2]):
+        yield [tuple(res) for res in matches]
+
+
+def align_index(bowtie_index: str, primer_dict: dict, *run_bowtie_args,
+                batch: int = None):
     """
-    If no bowtie-index is specified we have to build it.
-    :param index_location: Either user specified location of the bowtie index
-    or the default path constructed
-    :param fasta_file_location: path to the fasta file containing the sequences
-    :param debug: whether debug logging is set on or off.
-    :param bowtie_exec: str containing the path to bowtie executable.
-    bowtie-build is supposed to be in the same folder.
+    Runs bowtie against one index unless the alignment has been completed by
+    an interrupted run, see --resume. With checkpoints the results are
+    stored as soon as bowtie finished.
+    :param bowtie_index: location of the index for bowtie
+    :param primer_dict: Dictionary containing all primer pairs
+    :param run_bowtie_args: remaining arguments of run_bowtie following the
+    index and primer_dict
+    :param batch: number of the batch of primer pairs, every batch has its
+    own checkpoint
+    :return: iterable of tuples of SAM records, see run_bowtie
     """
-    bowtie_index_dir = index_location.split('/')[0]
-    # create new directory for the index,
-    # no problem if specific folder already exists
-    os.makedirs(bowtie_index_dir, exist_ok=True)
-    # determine name for index from name of the
-    # FASTA-file containing the sequences
-    bowtie_build = bowtie_exec + '-build'
-    args = [bowtie_build, fasta_file_location, index_location]
-    logging.info('bowtie-build command: {}'.format(args))
-    if not debug:
-        # We are not in debug-mode so no output will be shown
-        subprocess.call(args, stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL)
-    else:
-        # debug-mode, show everything
-        subprocess.call(args)
+    if not runtime_parameters['checkpoint_dir']:
+        return run_bowtie(bowtie_index, primer_dict, *run_bowtie_args)
+    stage = 'alignment_{}'.format(os.path.basename(bowtie_index))
+    if batch is not None:
+        stage += '_batch{}'.format(batch)
+    key = cache_key(bowtie_index, index_modification_time(bowtie_index),
+                    sorted(primer_dict.items()))
+    records = checkpoint_load(stage, key)
+    if records is None:
+        records = list(run_bowtie(bowtie_index, primer_dict,
+                                  *run_bowtie_args))
+        checkpoint_store(stage, key, records)
+    return records
 
 
-def run_bowtie(bowtie_index: str, files_prefix: str, bowtie_exec: str,
+def run_bowtie(bowtie_index: str, primer_dict: dict, bowtie_exec: str,
                silent: bool, size_range: tuple,
-               bowtie_output: bool) -> list:
+               bowtie_output: bool, mmap_output: bool = False):
     """
     Calls bowtie to execute the search for matches of the designed primers with
-    other sequences.
+    other sequences. The primer are streamed to bowtie through named pipes
+    inside a private directory of the run, so no primer files are read and
+    concurrent runs do not interfere.
     :param bowtie_index: location of the index for bowtie
-    :param files_prefix: the prefix of the files containing the primer
+    :param primer_dict: Dictionary containing all primer pairs
     :param bowtie_exec: bowtie-executable, either default or defined by user
     :param silent: whether we run in silent, decides whether bowtie output
     shall be shown
     :param size_range: given size range of the primer, we therefore only look
     for inserts of this size range
     :param bowtie_output: whether output of bowtie shall be written to STDERR
-    :return: list of tuples consisting of the hits
+    :param mmap_output: whether bowtie shall write to a temporary file which
+    is memory mapped and parsed lazily
+    :return: iterable of tuples consisting of the SAM records of the hits of
+    both primer, see parse_sam_line
     """
-    # determine name of files where the previously found primers are stored
-    left = "{}_left.fas".format(files_prefix)
-    right = "{}_right.fas".format(files_prefix)
+    call_dir = tempfile.mkdtemp(prefix='bowtie_', dir=run_workspace())
+    left = os.path.join(call_dir, 'left.fas')
+    right = os.path.join(call_dir, 'right.fas')
+    writers = stream_primer(primer_dict, left, right)
     # base for calling bowtie
     args = [bowtie_exec, "-k", "5000", "-S", "-f", bowtie_index, "-1",
             left, "-2", right, "--sam-nohead", '--minins', str(size_range[0]),
             '--maxins', str(size_range[1])]
+    if silent:
+        args += ['--quiet']
+    else:
+        logging.info('Bowtie result summary:')
+    if mmap_output:
+        # let bowtie write into a file which is scanned without decoding it
+        sam_file = os.path.join(call_dir, 'hits.sam')
+        args.append(sam_file)
     logging.info('Calling bowtie: {}'.format(args))
+    if not mmap_output:
+        # the output is parsed while bowtie is still aligning, so the results
+        # of the first pairs are available before the last ones are aligned
+        process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        return pair_sam_records(iter_bowtie_output(
+            process, writers, (left, right), bowtie_output))
     try:
-        if silent:
-            args += ['--quiet']
-            res = subprocess.check_output(args).decode('utf-8').split('\n')
-        else:
-            logging.info('Bowtie result summary:')
-            res = subprocess.check_output(args).decode('utf-8').split('\n')
+        subprocess.check_call(args)
     except subprocess.CalledProcessError as e:
         logging.error('Something went wrong during bowtie execution. Following '
                       'error occured: {}\nMaybe a corrupt index?'.format(e))
         sys.exit(1)
+    finally:
+        finish_primer_streams(writers, (left, right))
 
     if bowtie_output:
         logging.info('Printing bowtie result to STDERR as requested by '
                      '--show-bowtie')
-        print('\n'.join(res), file=sys.stderr)
+        with open(sam_file, 'r') as sam:
+            shutil.copyfileobj(sam, sys.stderr)
         sys.stderr.flush()
+    return pair_sam_records(iter_sam_file_records(sam_file, delete=True))
+
+
+def iter_bowtie_output(process: subprocess.Popen, writers: list,
+                       paths: tuple, bowtie_output: bool):
+    """
+    Reads the SAM output of a running bowtie process line by line and extracts
+    the fields of every record as soon as bowtie has written it.
+    :param process: bowtie process writing SAM to its STDOUT
+    :param writers: threads feeding the primer to bowtie, see stream_primer
+    :param paths: paths of the pipes of the primer
+    :param bowtie_output: whether output of bowtie shall be written to STDERR
+    :return: Generator of records as described in parse_sam_line
+    """
+    if bowtie_output:
+        logging.info('Printing bowtie result to STDERR as requested by '
+                     '--show-bowtie')
+    try:
+        for line in process.stdout:
+            line = line.decode('utf-8')
+            if bowtie_output:
+                sys.stderr.write(line)
+            line = line.rstrip('\n')
+            if line and line[0] != '@':
+                yield parse_sam_line(line)
+    finally:
+        # closing the pipe stops bowtie if the results are not read completely
+        process.stdout.close()
+        returncode = process.wait()
+        finish_primer_streams(writers, paths)
+    if returncode:
+        logging.error('Something went wrong during bowtie execution. Following '
+                      'error occured: {}\nMaybe a corrupt index?'.format(
+                          subprocess.CalledProcessError(returncode,
+                                                        process.args)))
+        sys.exit(1)
 
-    # Each match is described in two lines since FWD and REV have to match.
-    res_tuple = [
-        (res[i], res[i + 1]) for i in range(0, len(res) - 1, 2)]
-    return res_tuple
+
+def run_workspace() -> str:
+    """
+    Returns the private directory of this run, which is created on first use
+    and removed when the program exits.
+    :return: path of the directory
+    """
+    global workspace
+    if workspace is None:
+        workspace = tempfile.mkdtemp(prefix='genuprimer_')
+        atexit.register(shutil.rmtree, workspace, True)
+        logging.debug('Created private workspace {}'.format(workspace))
+    return workspace
 
 
-def generate_primer(sequence: str, primer3_options_dict: dict,
-                    primer_file_prefix: str, ) -> dict:
+def write_primer_fasta(path: str, records: list):
     """
-    Calls the primer3-module with the settings and separates the results in
-    left and right primer pairs.
-    :param sequence: Sequence template for the primers
-    :param primer3_options_dict: Dictionary containing all user specified
-    settings for primer3.
-    :param primer_file_prefix: prefix for the files where the primer pairs will
-    be stored.
-    :return: A dictionary containing all primer pairs and their names
+    Writes primer in FASTA format, executed by the threads feeding bowtie.
+    :param path: file or named pipe
+    :param records: list of tuples of id and sequence
+    """
+    try:
+        with open(path, 'w') as fasta:
+            for primer_id, sequence in records:
+                fasta.write('>{}\n{}\n'.format(primer_id, sequence))
+    except BrokenPipeError:
+        # bowtie stopped reading, its error is reported by run_bowtie
+        pass
+
+
+def stream_primer(primer_dict: dict, left: str, right: str) -> list:
+    """
+    Creates named pipes for the forward and reverse primer and starts threads
+    writing the primer into them as soon as bowtie opens them. On systems
+    without named pipes regular files are written instead.
+    :param primer_dict: Dictionary containing all primer pairs
+    :param left: path of the pipe of the forward primer
+    :param right: path of the pipe of the reverse primer
+    :return: list of the started threads
+    """
+    ids = [pair_ids(key) for key in primer_dict]
+    records = [[(primer_id[side], pair[side])
+                for primer_id, pair in zip(ids, primer_dict.values())]
+               for side in (0, 1)]
+    if not hasattr(os, 'mkfifo'):
+        write_primer_fasta(left, records[0])
+        write_primer_fasta(right, records[1])
+        return []
+    writers = []
+    for path, side_records in zip((left, right), records):
+        os.mkfifo(path)
+        writer = threading.Thread(target=write_primer_fasta,
+                                  args=(path, side_records), daemon=True)
+        writer.start()
+        writers.append(writer)
+    return writers
+
+
+def finish_primer_streams(writers: list, paths: tuple):
+    """
+    Waits for the threads started by stream_primer. If bowtie exited without
+    opening a pipe, the pipe is opened here so the waiting thread is released.
+    :param writers: threads returned by stream_primer
+    :param paths: paths of the pipes
+    """
+    for writer, path in zip(writers, paths):
+        if writer.is_alive():
+            try:
+                os.close(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        writer.join()
+
+
+def pair_sam_records(records):
+    """
+    Each match is described in two lines since FWD and REV have to match,
+    therefore the records are combined pairwise.
+    :param records: Iterable of SAM records
+    :return: Iterator of tuples of the FWD and REV record
+    """
+    records = iter(records)
+    return zip(records, records)
+
+
+def parse_sam_line(line: str) -> tuple:
+    """
+    Extracts the fields needed for the evaluation of a hit from one line of
+    the SAM output of bowtie.
+    :param line: line of the SAM output
+    :return: tuple of QNAME, FLAG, RNAME, POS, PNEXT, TLEN and the value of the
+    MD:Z tag, which is None for lines not describing an alignment. See the
+    SAM_* constants for the positions inside the tuple.
+    """
+    fields = line.split('\t')
+    md = None
+    # optional fields start after the 11 mandatory ones
+    for field in fields[11:]:
+        if field.startswith('MD:Z:'):
+            md = field[5:].rstrip()
+            break
+    return (fields[0], int(fields[1]), fields[2], int(fields[3]),
+            int(fields[7]), int(fields[8]), md)
+
+
+def iter_sam_file_records(sam_file: str, delete: bool = False):
+    """
+    Memory maps a SAM file and extracts the fields needed for the evaluation
+    of a hit by searching the offsets of the separating tabs. Only these fields
+    are converted to python objects instead of splitting every line.
+    :param sam_file: path to the SAM file
+    :param delete: whether the file shall be deleted after it has been read
+    :return: Generator of records as described in parse_sam_line
+    """
+    try:
+        with open(sam_file, 'rb') as sam:
+            if os.fstat(sam.fileno()).st_size == 0:
+                return
+            with mmap.mmap(sam.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                size = len(buf)
+                start = 0
+                while start < size:
+                    end = buf.find(b'\n', start)
+                    if end == -1:
+                        end = size
+                    if end > start and buf[start] != SAM_HEADER_CHAR:
+                        yield parse_sam_buffer(buf, start, end)
+                    start = end + 1
+    finally:
+        if delete:
+            os.remove(sam_file)
+
+
+def parse_sam_buffer(buf: mmap.mmap, start: int, end: int) -> tuple:
+    """
+    Extracts the fields of one SAM line located between start and end of the
+    memory mapped file, see iter_sam_file_records.
+    :param buf: memory mapped SAM file
+    :param start: offset of the beginning of the line
+    :param end: offset of the newline terminating the line
+    :return: record as described in parse_sam_line
+    """
+    # offsets of the tabs terminating the first nine fields
+    tabs = []
+    tab = start - 1
+    for _ in range(9):
+        tab = buf.find(b'\t', tab + 1, end)
+        tabs.append(tab)
+    md = None
+    md_start = buf.find(b'\tMD:Z:', tabs[8], end)
+    if md_start != -1:
+        md_start += 6
+        md_end = buf.find(b'\t', md_start, end)
+        if md_end == -1:
+            md_end = end
+        md = buf[md_start:md_end].decode('ascii').rstrip()
+    return (buf[start:tabs[0]].decode('utf-8'),
+            int(buf[tabs[0] + 1:tabs[1]]),
+            buf[tabs[1] + 1:tabs[2]].decode('utf-8'),
+            int(buf[tabs[2] + 1:tabs[3]]),
+            int(buf[tabs[6] + 1:tabs[7]]),
+            int(buf[tabs[7] + 1:tabs[8]]),
+            md)
+
+
+def import_primer3():
+    """
+    Imports primer3-py and aborts if it is not installed.
+    :return: the primer3 module
     """
     try:
         import primer3
@@ -905,6 +3648,35 @@ def generate_primer(sequence: str, primer3_options_dict: dict,
                       'https://libnano.github.io/primer3-py\n'
                       'Aborting')
         sys.exit(1)
+    return primer3
+
+
+def generate_primer(sequence: str, primer3_options_dict: dict,
+                    primer_file_prefix: str,
+                    misprime_library: dict = None,
+                    pair_ok_region_list: list = None,
+                    included_region: tuple = None) -> dict:
+    """
+    Calls the primer3-module with the settings and separates the results in
+    left and right primer pairs.
+    :param sequence: Sequence template for the primers
+    :param primer3_options_dict: Dictionary containing all user specified
+    settings for primer3.
+    :param primer_file_prefix: prefix for the files where the primer pairs will
+    be stored, no files are written if it is None.
+    :param misprime_library: Dictionary of sequences primer3 shall penalize
+    primer to bind to.
+    :param pair_ok_region_list: SEQUENCE_PRIMER_PAIR_OK_REGION_LIST for
+    primer3, default is the one derived from the insert position
+    :param included_region: region including all possible products, default
+    is the one derived from the insert position
+    :return: A dictionary containing all primer pairs and their names
+    """
+    primer3 = import_primer3()
+    if pair_ok_region_list is None:
+        pair_ok_region_list = primer3_pair_ok_region_list
+    if included_region is None:
+        included_region = sequence_included_region
 
     # remove any newlines or anything else like that
     sequence = sequence.replace('\n', '').replace('\r', '')
@@ -915,23 +3687,31 @@ def generate_primer(sequence: str, primer3_options_dict: dict,
         {'PRIMER_PRODUCT_SIZE_RANGE': product_size_range}
     )
 
+    pair_ok_region_list, included_region = clip_to_template(
+        pair_ok_region_list, included_region, len(sequence))
+    if pair_ok_region_list is None:
+        logging.warning('No room for primer left or right of the region of '
+                        'interest, it is too close to the start or end of '
+                        'the template')
+        return {}
+
     primer3.bindings.setP3Globals(primer3_options_dict)
     # generate primers for the whole sequence?
     logging.info(
         'Product size: {}'.format(product_size_range)
     )
     logging.debug(
-        'OK_REGION_LIST for primer3: {}'.format(primer3_pair_ok_region_list))
+        'OK_REGION_LIST for primer3: {}'.format(pair_ok_region_list))
     res = primer3.bindings.designPrimers({
         'SEQUENCE_ID': 'mySequence',
         'SEQUENCE_TEMPLATE': sequence,
         # give start of sequence and length
-        'SEQUENCE_PRIMER_PAIR_OK_REGION_LIST': primer3_pair_ok_region_list,
-        'SEQUENCE_INCLUDED_REGION': [sequence_included_region[0],
-                                     sequence_included_region[1] -
-                                     sequence_included_region[0]]
+        'SEQUENCE_PRIMER_PAIR_OK_REGION_LIST': pair_ok_region_list,
+        'SEQUENCE_INCLUDED_REGION': [included_region[0],
+                                     included_region[1] -
+                                     included_region[0]]
 
-    })
+    }, misprime_lib=misprime_library)
 
     primer_left = {}  # type: dict
     primer_right = {}  # type: dict
@@ -947,12 +3727,6 @@ def generate_primer(sequence: str, primer3_options_dict: dict,
             elif line[1] in ['LEFT'] and \
                     line[3] == 'SEQUENCE':
                 primer_left.update({k: res[k]})
-    # write the found primer to their corresponding files
-    logging.debug('Opening files to write primers')
-    primerfile_left = open(
-        '{prefix}_left.fas'.format(prefix=primer_file_prefix), 'w')
-    primerfile_right = open(
-        '{prefix}_right.fas'.format(prefix=primer_file_prefix), 'w')
 
     def extract_number(x: str) -> int:
         """
@@ -964,27 +3738,471 @@ def generate_primer(sequence: str, primer3_options_dict: dict,
 
     primer_dict = {}
 
-    logging.debug(
-        'Writing primers to files: {}, {}'.format(primerfile_left.name,
-                                                  primerfile_right.name))
     for left_key, right_key in zip(
         sorted(primer_left.keys(), key=extract_number),
         sorted(primer_right.keys(), key=extract_number)
     ):
-        # format in FASTA-style
-        left_line = ">{}\n{}\n\n".format(left_key, primer_left[left_key])
-        right_line = ">{}\n{}\n\n".format(right_key, primer_right[right_key])
-        primerfile_left.write(left_line)
-        primerfile_right.write(right_line)
         primer_dict.update({tuple(sorted((left_key, right_key))): (
             primer_left[left_key], primer_right[right_key])})
+        number = extract_number(left_key)
+        primer_pair_info.setdefault(tuple(sorted((left_key, right_key))),
+                                    {}).update({
+            'penalty': res.get('PRIMER_PAIR_{}_PENALTY'.format(number), 0.0),
+            # first base of the left and last base of the right primer
+            'amplicon': (res['PRIMER_LEFT_{}'.format(number)][0],
+                         res['PRIMER_RIGHT_{}'.format(number)][0] + 1)})
+
+    if primer_file_prefix is not None:
+        write_primer_files(primer_dict, primer_file_prefix)
+    return primer_dict
+
+
+def design_tile(window_number: int, sequence: str, offset: int,
+                pair_ok_region_list: list, product_size: tuple,
+                primer3_options_dict: dict, misprime_library: dict) -> tuple:
+    """
+    Generates the primer pairs for one window of a tiled region, executed
+    inside the worker processes of design_tiles.
+    :param window_number: number of the window, used to name the primer
+    :param sequence: part of the template containing all possible products
+    of the window
+    :param offset: position of this part inside the whole template
+    :param pair_ok_region_list: SEQUENCE_PRIMER_PAIR_OK_REGION_LIST relative
+    to the part of the template
+    :param product_size: minimal and maximal size of the product
+    :param primer3_options_dict: settings for primer3
+    :param misprime_library: Dictionary of sequences primer3 shall penalize
+    primer to bind to.
+    :return: tuple of the primer pairs and their additional information,
+    keyed like primer_dict and with absolute positions
+    """
+    global primer3_product_size
+    primer3_product_size = product_size
+    primer_dict = generate_primer(sequence, primer3_options_dict, None,
+                                  misprime_library, pair_ok_region_list,
+                                  (0, len(sequence)))
+    tile_dict, tile_info = {}, {}
+    for key, pair in primer_dict.items():
+        tile_key = tuple('TILE{}_{}'.format(window_number, primer_id)
+                         for primer_id in key)
+        tile_dict[tile_key] = pair
+        info = primer_pair_info.get(key, {})
+        tile_info[tile_key] = {
+            'penalty': info.get('penalty', 0.0),
+            'amplicon': (info['amplicon'][0] + offset,
+                         info['amplicon'][1] + offset),
+            'window': window_number,
+            'region': (offset, offset + len(sequence))}
+    return tile_dict, tile_info
 
-    primerfile_left.close()
-    primerfile_right.close()
 
+def design_tiles(sequence: str, windows: list, primer3_options_dict: dict,
+                 misprime_library: dict, processes: int) -> dict:
+    """
+    Generates primer pairs for all windows of a tiled region in parallel.
+    Every window is designed on the part of the template containing its
+    possible products, so only this part is passed to the worker processes.
+    :param sequence: template of the whole region
+    :param windows: begin and end of the region of interest of each window
+    :param primer3_options_dict: settings for primer3
+    :param misprime_library: Dictionary of sequences primer3 shall penalize
+    primer to bind to.
+    :param processes: number of processes
+    :return: A dictionary containing the primer pairs of all windows
+    """
+    tasks = []
+    for window_number, window in enumerate(windows):
+        pair_ok_region_list, included_region = compute_pair_ok_region(
+            window, primer3_product_size)
+        offset = max(0, included_region[0])
+        tasks.append((window_number, sequence[offset:included_region[1]],
+                      offset,
+                      [pair_ok_region_list[0] - offset, pair_ok_region_list[1],
+                       pair_ok_region_list[2] - offset, pair_ok_region_list[3]],
+                      primer3_product_size, primer3_options_dict,
+                      misprime_library))
+    primer_dict = {}
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        for tile_dict, tile_info in pool.map(design_tile, *zip(*tasks)):
+            primer_dict.update(tile_dict)
+            primer_pair_info.update(tile_info)
+    logging.info('Generated {} primer pairs for {} windows'.format(
+        len(primer_dict), len(windows)))
     return primer_dict
 
 
+def select_tiling_path(windows: list, validated: dict) -> list:
+    """
+    Selects one primer pair per window, so that the products of adjacent
+    windows overlap each other and every selected pair has exactly one hit,
+    its expected one. Among all such paths the one with the lowest sum of
+    primer3 penalties is selected via dynamic programming. Windows without
+    any suitable pair split the path.
+    :param windows: begin and end of the region of interest of each window
+    :param validated: Dictionary of the results of every pair which has not
+    been omitted
+    :return: list of the selected keys per window, None for gaps
+    """
+    candidates = [[] for _ in windows]  # type: list
+    for key, matches in validated.items():
+        info = primer_pair_info.get(key, {})
+        if 'window' in info and len(matches) == 1 and matches[0][8]:
+            candidates[info['window']].append(key)
+
+    def penalty(key: tuple) -> float:
+        return primer_pair_info[key]['penalty']
+
+    def overlapping(left: tuple, right: tuple) -> bool:
+        return primer_pair_info[right]['amplicon'][0] < \
+            primer_pair_info[left]['amplicon'][1]
+
+    # lowest cost of a path ending with a pair and its predecessor
+    best = [{} for _ in windows]  # type: list
+    for window_number, keys in enumerate(candidates):
+        previous = best[window_number - 1] if window_number else {}
+        for key in keys:
+            reachable = [(cost, predecessor)
+                         for predecessor, (cost, _) in previous.items()
+                         if overlapping(predecessor, key)]
+            cost, predecessor = min(reachable) if reachable else (0.0, None)
+            best[window_number][key] = (cost + penalty(key), predecessor)
+
+    path = [None] * len(windows)  # type: list
+    key = None
+    for window_number in reversed(range(len(windows))):
+        costs = best[window_number]
+        if key is None and costs:
+            # end of the path or of a segment, select the cheapest pair
+            key = min(costs, key=lambda k: costs[k][0])
+        path[window_number] = key
+        key = costs[key][1] if key is not None else None
+    for window_number, key in enumerate(path):
+        if key is None:
+            logging.warning('No unique primer pair found for window {} '
+                            '{}'.format(window_number, windows[window_number]))
+        elif window_number and path[window_number - 1] is not None and \
+                best[window_number][key][1] is None:
+            logging.warning('Products of window {} and {} do not overlap'
+                            .format(window_number - 1, window_number))
+    return path
+
+
+def write_tiling_path(path: str, primer_dict: dict, windows: list,
+                      tiling_path: list):
+    """
+    Writes the primer pairs selected by select_tiling_path as comma separated
+    values.
+    :param path: location of the file
+    :param primer_dict: Dictionary containing all primer pairs
+    :param windows: begin and end of the region of interest of each window
+    :param tiling_path: list of the selected keys per window
+    """
+    with open(path, 'w') as tiling_file:
+        tiling_file.write(TILING_PATH_HEADER + '\n')
+        for window_number, key in enumerate(tiling_path):
+            if key is None:
+                continue
+            info = primer_pair_info[key]
+            tiling_file.write(','.join(map(str, (
+                window_number,) + tuple(windows[window_number]) +
+                pair_ids(key) + primer_dict[key] + tuple(info['amplicon']) +
+                (info['penalty'],))) + '\n')
+
+
+def write_primer_files(primer_dict: dict, primer_file_prefix: str):
+    """
+    Writes the primer pairs to the files read by bowtie.
+    :param primer_dict: Dictionary containing all primer pairs, accessible via
+    sorted concatenation of fwd-primer-id and rev-primer-id.
+    :param primer_file_prefix: prefix for the files where the primer pairs will
+    be stored.
+    """
+    # write the found primer to their corresponding files
+    logging.debug('Opening files to write primers')
+    with open('{prefix}_left.fas'.format(prefix=primer_file_prefix),
+              'w') as primerfile_left, \
+            open('{prefix}_right.fas'.format(prefix=primer_file_prefix),
+                 'w') as primerfile_right:
+        logging.debug(
+            'Writing primers to files: {}, {}'.format(primerfile_left.name,
+                                                      primerfile_right.name))
+        for key, (left_seq, right_seq) in primer_dict.items():
+            left_key, right_key = pair_ids(key)
+            # format in FASTA-style
+            left_line = ">{}\n{}\n\n".format(left_key, left_seq)
+            right_line = ">{}\n{}\n\n".format(right_key, right_seq)
+            primerfile_left.write(left_line)
+            primerfile_right.write(right_line)
+
+
+def reverse_complement(sequence: str) -> str:
+    """
+    Calculates the reverse complement of a sequence, IUPAC codes included.
+    :param sequence: sequence of bases
+    :return: reverse complement in upper case
+    """
+    return sequence.upper().translate(COMPLEMENT)[::-1]
+
+
+def pair_ids(key: tuple) -> tuple:
+    """
+    Returns the ids of the forward and the reverse primer of a pair.
+    :param key: key of the pair inside primer_dict
+    :return: tuple of the id of the forward and reverse primer
+    """
+    return primer_pair_ids.get(key, key)
+
+
+def score_heterodimers(sequence_pairs: list) -> list:
+    """
+    Calculates the delta G of the heterodimers of the given primer, executed
+    inside the worker processes of screen_panel.
+    :param sequence_pairs: list of tuples of two primer sequences
+    :return: list of the delta G values in cal/mol
+    """
+    primer3 = import_primer3()
+    # primer3-py 2 renamed the functions, the old names are deprecated
+    calc_heterodimer = getattr(primer3, 'calc_heterodimer', None) or \
+        primer3.calcHeterodimer
+    return [calc_heterodimer(first, second).dg
+            for first, second in sequence_pairs]
+
+
+def screen_panel(primer_dict: dict, kmer: int, max_dg: float,
+                 processes: int) -> list:
+    """
+    Searches for primer of different pairs which would form heterodimers if
+    all pairs are used together in one multiplex panel. Instead of scoring
+    every combination of primer, an index of all k-mers of all primer is used
+    to find the primer whose 3'-end is complementary to any part of another
+    primer. Only those candidates are scored by primer3, in parallel.
+    :param primer_dict: Dictionary containing all primer pairs of the panel
+    :param kmer: number of bases at the 3'-end which have to be complementary
+    to consider two primer a candidate
+    :param max_dg: delta G in cal/mol, heterodimers with a lower value are
+    considered incompatible
+    :param processes: number of processes used to score the candidates
+    :return: list of tuples describing the incompatible primer, consisting of
+    the key of the first pair, the position of the primer inside it, the key
+    of the second pair, the position of the primer inside it and the delta G
+    """
+    primers = [(key, position, sequence.upper())
+               for key, pair in primer_dict.items()
+               for position, sequence in enumerate(pair)]
+    kmer_index = {}  # type: dict
+    for i, (_, _, sequence) in enumerate(primers):
+        for start in range(len(sequence) - kmer + 1):
+            kmer_index.setdefault(sequence[start:start + kmer], set()).add(i)
+    candidates = set()
+    for i, (key, _, sequence) in enumerate(primers):
+        if len(sequence) < kmer:
+            continue
+        for j in kmer_index.get(reverse_complement(sequence[-kmer:]), ()):
+            # dimers inside of one pair are checked by primer3 during design
+            if primers[j][0] != key:
+                candidates.add((min(i, j), max(i, j)))
+    candidates = sorted(candidates)
+    logging.info('Scoring {} of {} possible combinations of primer for '
+                 'heterodimers'.format(
+                     len(candidates), len(primers) * (len(primers) - 1) // 2))
+    if not candidates:
+        return []
+    import_primer3()
+    sequence_pairs = [(primers[i][2], primers[j][2]) for i, j in candidates]
+    chunks = [sequence_pairs[i:i + PANEL_SCORE_CHUNK_SIZE]
+              for i in range(0, len(sequence_pairs), PANEL_SCORE_CHUNK_SIZE)]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        scores = [dg for chunk in pool.map(score_heterodimers, chunks)
+                  for dg in chunk]
+    incompatible = []
+    for (i, j), dg in zip(candidates, scores):
+        if dg < max_dg:
+            incompatible.append((primers[i][0], primers[i][1],
+                                 primers[j][0], primers[j][1], dg))
+    return incompatible
+
+
+def resolve_panel_conflicts(primer_dict: dict, incompatible: list) -> list:
+    """
+    Removes primer pairs from the panel until no incompatible primer are left,
+    always removing the pair involved in the most conflicts first.
+    :param primer_dict: Dictionary containing all primer pairs of the panel,
+    modified in place
+    :param incompatible: incompatible primer as returned by screen_panel
+    :return: list of the keys of the removed pairs
+    """
+    conflicts = {}  # type: dict
+    for first, _, second, _, _ in incompatible:
+        conflicts.setdefault(first, set()).add(second)
+        conflicts.setdefault(second, set()).add(first)
+    removed = []
+    while conflicts:
+        worst = max(conflicts, key=lambda key: (len(conflicts[key]), key))
+        for other in conflicts.pop(worst):
+            conflicts[other].discard(worst)
+            if not conflicts[other]:
+                del conflicts[other]
+        primer_dict.pop(worst, None)
+        removed.append(worst)
+    return removed
+
+
+def write_panel_report(path: str, incompatible: list):
+    """
+    Writes the incompatible primer found by screen_panel as comma separated
+    values.
+    :param path: location of the report
+    :param incompatible: incompatible primer as returned by screen_panel
+    """
+    with open(path, 'w') as report:
+        report.write(PANEL_REPORT_HEADER + '\n')
+        for first, first_position, second, second_position, dg in \
+                incompatible:
+            report.write(','.join(map(str, pair_ids(first) + (
+                pair_ids(first)[first_position],) + pair_ids(second) + (
+                pair_ids(second)[second_position], '{:.1f}'.format(dg)))))
+            report.write('\n')
+
+
+def pair_target(key: tuple) -> str:
+    """
+    Returns the target of a primer pair, which is either annotated, the
+    window of a tiled region or the sequence the primer have been generated
+    for.
+    :param key: key of the pair inside primer_dict
+    :return: name of the target
+    """
+    info = primer_pair_info.get(key, {})
+    if 'window' in info:
+        return 'TILE{}'.format(info['window'])
+    return info.get('target', runtime_parameters['seq_id'])
+
+
+def shared_off_target_conflicts(validated: dict) -> list:
+    """
+    Searches for primer pairs whose not expected hits overlap, such pairs
+    would amplify the same off-target product inside one panel.
+    :param validated: Dictionary of the results of every pair
+    :return: list of tuples of the keys of two conflicting pairs
+    """
+    off_targets = sorted(
+        (res[2], min(res[5], res[6]), max(res[5], res[6]), key)
+        for key, matches in validated.items()
+        for res in matches if not res[8])
+    conflicts = set()
+    # sweep over the sorted hits and compare each one with all still open
+    open_hits = []  # type: list
+    for match_id, start, stop, key in off_targets:
+        open_hits = [hit for hit in open_hits
+                     if hit[0] == match_id and hit[1] >= start]
+        for _, _, other in open_hits:
+            if other != key:
+                conflicts.add(tuple(sorted((key, other))))
+        open_hits.append((match_id, stop, key))
+    return sorted(conflicts)
+
+
+def optimize_panel(primer_dict: dict, validated: dict,
+                   time_budget: float) -> dict:
+    """
+    Selects one primer pair per target, so that the selected pairs can be used
+    together in one multiplex panel. A greedy selection, beginning with the
+    targets with the fewest candidates, is improved by local search which
+    exchanges the pair of one target at a time until no exchange improves the
+    selection or the time budget is exceeded.
+    The cost of a selection is the sum of the primer3 penalties and the number
+    of not expected hits of all selected pairs, conflicts between selected
+    pairs, heterodimers or overlapping off-target products, are weighted by
+    PANEL_CONFLICT_COST.
+    :param primer_dict: Dictionary containing all primer pairs
+    :param validated: Dictionary of the results of every pair which has not
+    been omitted
+    :param time_budget: maximal number of seconds spent for the optimization
+    :return: Dictionary of the selected key per target
+    """
+    deadline = time.monotonic() + time_budget
+    candidates = {}  # type: dict
+    cost = {}  # type: dict
+    for key, matches in validated.items():
+        # pairs must at least amplify their target
+        if not any(res[8] for res in matches):
+            continue
+        candidates.setdefault(pair_target(key), []).append(key)
+        cost[key] = primer_pair_info.get(key, {}).get('penalty', 0.0) + \
+            sum(1 for res in matches if not res[8])
+    for target in set(map(pair_target, primer_dict)) - set(candidates):
+        logging.warning('No valid primer pair found for target {}'.format(
+            target))
+
+    panel = {key: primer_dict[key] for key in cost}
+    conflicts = {key: set() for key in cost}  # type: dict
+    incompatible = screen_panel(panel, runtime_parameters['panel_kmer'],
+                                runtime_parameters['panel_max_dg'],
+                                runtime_parameters['threads'])
+    for first, second in [(first, second)
+                          for first, _, second, _, _ in incompatible] + \
+            shared_off_target_conflicts({key: validated[key] for key in cost}):
+        conflicts[first].add(second)
+        conflicts[second].add(first)
+
+    selection = {}  # type: dict
+    selected = set()
+
+    def move_cost(key: tuple) -> float:
+        """
+        Cost of adding the pair to the currently selected ones.
+        :param key: key of the pair
+        :return: cost including all conflicts with the selected pairs
+        """
+        return cost[key] + PANEL_CONFLICT_COST * len(conflicts[key] & selected)
+
+    for target in sorted(candidates, key=lambda t: len(candidates[t])):
+        best = min(candidates[target], key=move_cost)
+        selection[target] = best
+        selected.add(best)
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for target, current in list(selection.items()):
+            if time.monotonic() >= deadline:
+                logging.info('Time budget for the optimization of the panel '
+                             'exceeded')
+                break
+            selected.discard(current)
+            best = min(candidates[target],
+                       key=lambda key: (move_cost(key), key != current))
+            if best != current and \
+                    move_cost(best) < move_cost(current):
+                selection[target] = best
+                improved = True
+            selected.add(selection[target])
+    remaining = sum(len(conflicts[key] & selected) for key in selected) // 2
+    logging.info('Selected {} primer pairs for the panel with {} remaining '
+                 'conflicts'.format(len(selection), remaining))
+    return selection
+
+
+def write_panel_selection(path: str, primer_dict: dict, validated: dict,
+                          selection: dict):
+    """
+    Writes the primer pairs selected by optimize_panel as comma separated
+    values.
+    :param path: location of the file
+    :param primer_dict: Dictionary containing all primer pairs
+    :param validated: Dictionary of the results of every pair
+    :param selection: Dictionary of the selected key per target
+    """
+    with open(path, 'w') as panel_file:
+        panel_file.write(PANEL_SELECTION_HEADER + '\n')
+        for target in sorted(selection):
+            key = selection[target]
+            panel_file.write(','.join(map(str, (target,) + pair_ids(key) +
+                                          primer_dict[key] + (
+                primer_pair_info.get(key, {}).get('penalty', 0.0),
+                sum(1 for res in validated[key] if not res[8])))) + '\n')
+
+
 def parse_arguments() -> argparse.Namespace:
     """
     This function parses the commandline arguments via the argparse-module,
@@ -995,7 +4213,7 @@ def parse_arguments() -> argparse.Namespace:
 
     parser.add_argument(
         "fasta_file", type=argparse.FileType('r'), metavar='path_to_fasta_file',
-        help=arg_fasta_file_help
+        nargs='?', help=arg_fasta_file_help
     )
     parser.add_argument(
         "-s", "--sequence", type=str, metavar='prefix_of_seq_id',
@@ -1029,6 +4247,10 @@ def parse_arguments() -> argparse.Namespace:
         "--keep-primer", dest='keep_primer', action='store_true',
         help=arg_keep_primer_help
     )
+    parser.add_argument(
+        '--max-degenerate-variants', dest='max_degenerate_variants', type=int,
+        metavar='variants', help=arg_max_degenerate_variants_help
+    )
     parser.add_argument(
         '--last-must-match', dest='LAST_MUST_MATCH', type=int,
         help=arg_last_must_match_help
@@ -1069,6 +4291,135 @@ def parse_arguments() -> argparse.Namespace:
         "--bowtie", type=str, metavar='path_to_bowtie_executable',
         help=arg_bowtie_help
     )
+    parser.add_argument(
+        '--save-settings', type=str, metavar='path_to_snapshot',
+        dest='save_settings', help=arg_save_settings_help
+    )
+    parser.add_argument(
+        '--load-settings', type=str, metavar='path_to_snapshot',
+        dest='load_settings', help=arg_load_settings_help
+    )
+    parser.add_argument(
+        '--cache-dir', type=str, metavar='path_to_cache', dest='cache_dir',
+        help=arg_cache_dir_help
+    )
+    parser.add_argument(
+        '--checkpoint-dir', type=str, metavar='path', dest='checkpoint_dir',
+        help=arg_checkpoint_dir_help
+    )
+    parser.add_argument(
+        '--resume', action='store_true', help=arg_resume_help
+    )
+    parser.add_argument(
+        '--stream-output', dest='stream_output', action='store_true',
+        help=arg_stream_output_help
+    )
+    parser.add_argument(
+        '--output-format', dest='output_format', choices=['csv', 'columnar'],
+        help=arg_output_format_help
+    )
+    parser.add_argument(
+        '--compression', choices=['gzip', 'zstd'], help=arg_compression_help
+    )
+    parser.add_argument(
+        '--db', type=str, metavar='path', help=arg_db_help
+    )
+    parser.add_argument(
+        '--db-query', dest='db_query', nargs=argparse.REMAINDER,
+        metavar='query', help=arg_db_query_help
+    )
+    parser.add_argument(
+        '--queue', nargs=argparse.REMAINDER, metavar='command',
+        help=arg_queue_help
+    )
+    parser.add_argument(
+        '--no-primerfiles', dest='no_primerfiles', action='store_true',
+        help=arg_no_primerfiles_help
+    )
+    parser.add_argument(
+        '--max-memory', dest='max_memory', type=int, metavar='MiB',
+        help=arg_max_memory_help
+    )
+    parser.add_argument(
+        '--mmap-sam', dest='mmap_sam', action='store_true',
+        help=arg_mmap_sam_help
+    )
+    parser.add_argument(
+        '--dedup-reference', dest='dedup_reference',
+        choices=['expand', 'collapse'], help=arg_dedup_reference_help
+    )
+    parser.add_argument(
+        '--amplicon-info', dest='amplicon_info', action='store_true',
+        help=arg_amplicon_info_help
+    )
+    parser.add_argument(
+        '--merge-overlapping', dest='merge_overlapping', action='store_true',
+        help=arg_merge_overlapping_help
+    )
+    parser.add_argument(
+        '--thermo-filter', dest='thermo_filter', action='store_true',
+        help=arg_thermo_filter_help
+    )
+    parser.add_argument(
+        '--thermo-max-dg', dest='thermo_max_dg', type=float, metavar='dG',
+        help=arg_thermo_max_dg_help
+    )
+    parser.add_argument(
+        '--shard-size', type=int, metavar='bases', dest='shard_size',
+        help=arg_shard_size_help
+    )
+    parser.add_argument(
+        '--threads', type=int, metavar='number_of_threads',
+        help=arg_threads_help
+    )
+    parser.add_argument(
+        '--panel-check', dest='panel_check', action='store_true',
+        help=arg_panel_check_help
+    )
+    parser.add_argument(
+        '--panel-kmer', dest='panel_kmer', type=int, metavar='bases',
+        help=arg_panel_kmer_help
+    )
+    parser.add_argument(
+        '--panel-max-dg', dest='panel_max_dg', type=float,
+        metavar='delta_g', help=arg_panel_max_dg_help
+    )
+    parser.add_argument(
+        '--panel-report', dest='panel_report', type=str,
+        metavar='path_to_report', help=arg_panel_report_help
+    )
+    parser.add_argument(
+        '--panel-drop', dest='panel_drop', action='store_true',
+        help=arg_panel_drop_help
+    )
+    parser.add_argument(
+        '--optimize-panel', dest='optimize_panel', type=str,
+        metavar='path_to_panel', help=arg_optimize_panel_help
+    )
+    parser.add_argument(
+        '--panel-time-budget', dest='panel_time_budget', type=float,
+        metavar='seconds', help=arg_panel_time_budget_help
+    )
+    parser.add_argument(
+        '--kmer-max-count', dest='kmer_max_count', type=int,
+        metavar='occurrences', help=arg_kmer_max_count_help
+    )
+    parser.add_argument(
+        '--kmer-misprime-library', dest='kmer_misprime_library', type=int,
+        metavar='number_of_kmers', help=arg_kmer_misprime_library_help
+    )
+    parser.add_argument(
+        '--tile', type=int, nargs=2, metavar=('begin', 'end'),
+        help=arg_tile_help
+    )
+    parser.add_argument(
+        '--tile-overlap', dest='tile_overlap', type=int, metavar='bases',
+        help=arg_tile_overlap_help
+    )
+    parser.add_argument(
+        '--tile-output', dest='tile_output', type=str,
+        metavar='path_to_tiling', help=arg_tile_output_help
+    )
     parser.set_defaults(keep_primer=False, show_bowtie_output=False)
     return parser.parse_args()
 
@@ -1081,31 +4432,31 @@ def parse_fasta(fasta_file: '_io.TextIOWrapper', seq_id: str) -> tuple:
     :param fasta_file: already readable-opened file which
     contains all the sequences
     """
-    seq_id_header = ""
-    # no sequence-id specified, therefore the first one is taken
-    if not seq_id:
-        # read one line to remove headerline from internal buffer
-        seq_id_header = fasta_file.readline().split()[0][1:]
-        logging.info(
-            'No seq_id passed, taking first sequence from {} with id {}'.format(
-                fasta_file.name, seq_id_header))
-        seq = extract_fasta_seq(fasta_file)
-    # a sequence-id has been passed to the programm
-    else:
+    if seq_id:
         logging.info('Partial sequence-id given: {}'.format(seq_id))
-        for line in fasta_file:
-            # begin of a new sequence and prefix-matching says true
-            if line[0] == '>' and line.startswith(seq_id, 1):
-                seq_id_header = line.split()[0][1:]
-                logging.info(
-                    'Found match of given sequence-id-prefix, '
-                    'using sequence with id {}'.format(
-                        seq_id_header))
-                break
-        seq = extract_fasta_seq(fasta_file)
-
-    return seq, seq_id_header
+    # records are parsed lazily, so the file is only read up to the match
+    for header, seq in iter_fasta(fasta_file):
+        # no sequence-id specified, therefore the first one is taken
+        if not seq_id:
+            logging.info(
+                'No seq_id passed, taking first sequence from {} with id '
+                '{}'.format(fasta_file.name, fasta_id(header)))
+            return seq, fasta_id(header)
+        # prefix-matching says true
+        if header.startswith(seq_id):
+            logging.info(
+                'Found match of given sequence-id-prefix, '
+                'using sequence with id {}'.format(fasta_id(header)))
+            return seq, fasta_id(header)
+    return '', ''
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ['--db-query']:
+        setup_logging('WARNING')
+        query_result_db(sys.argv[2:])
+    elif sys.argv[1:2] == ['--queue']:
+        setup_logging('INFO')
+        run_queue(sys.argv[2:])
+    else:
+        main()